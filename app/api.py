@@ -1,19 +1,43 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List, Dict
-import ollama
+import asyncio
 import json
+import logging
+import os
 import re
 import sys
+import time
 from pathlib import Path
 
 # Add parent directory to path to import rag modules
 sys.path.append(str(Path(__file__).parent.parent))
 
-from rag.retriever import loader, embedding, find_similarity, filter_by_metadata
+from rag.retriever import (
+    embedding, embed_texts, filter_by_metadata, rerank, search_batch, split_symptoms, fuse_rankings,
+    doc_id, doc_key, set_embedding_cache, get_embedding_cache
+)
+from rag.embed_cache import EmbeddingCache, SQLiteTier, RedisTier
 from rag.state import TriagState
-from rag.safety import SafetyDetector
+from rag.context import build_context
+from rag.condition_index import limit_per_condition, EXCLUDED_SECTIONS as DEFAULT_EXCLUDED_SECTIONS
+from rag.llm import LLMClient, LLMError, LLMTimeout
+from rag.tiering import ModelTiers
+from rag.deadline import Deadline, DeadlineExceeded
+from rag.scheduler import LLMScheduler, QueueFull, current_priority, priority_for, count_red_flags
+from rag.fallback import degraded_triage
+from rag.cassette import client_from_env, fixture_from_env
+from rag.threads import ThreadConfig, current_settings
+from rag.accounting import Usage, UsageTotals, current_usage, session_turn, stage as stage_timer
+from rag.stopping import StoppingPolicy, SessionMetrics, rank_conditions
+from rag.outcomes import log_from_env as outcome_log_from_env
+from app.startup import Startup
+from app.coalesce import SingleFlight, IdempotencyStore, SessionLocks, payload_hash
+from app.streaming import FieldStream
 
 app = FastAPI(title="Medical Triage API", version="1.0.0")
 
@@ -30,18 +54,122 @@ app.add_middleware(
 #session is a dictionary that have string as keys and dict as values
 sessions: Dict[str, Dict] = {}
 
+# Duplicate requests (retries, double clicks) share one in-flight run and
+# completed responses are replayed by idempotency key; turns of a session
+# are applied one at a time
+in_flight = SingleFlight()
+completed_requests = IdempotencyStore(ttl=600)
+session_locks = SessionLocks()
+
 # Initialize components
 CONFIDENCE_THRESHOLD = 0.75
-safety = SafetyDetector(
-    embed_fn=lambda t: embedding(t, "all-MiniLM-L6-v2"),
-    threshold=0.85
-)
+EMBED_MODEL = "all-MiniLM-L6-v2"
+LLM_MODEL = "qwen2.5:7b-instruct"
 
-# Load FAISS index and documents
 INDEX_PATH = str(Path(__file__).parent.parent / "embeddings" / "vector_store" / "faiss.index")
 DOCUMENTS_PATH = str(Path(__file__).parent.parent / "embeddings" / "vector_store" / "documents.json")
 
-index, documents = loader(INDEX_PATH, DOCUMENTS_PATH)
+# Retrieval first picks the closest conditions, then their sections
+TOP_CONDITIONS = 3
+MAX_CHUNKS_PER_CONDITION = 2
+# comma separated, defaults to rag.condition_index.EXCLUDED_SECTIONS
+EXCLUDED_SECTIONS = [s for s in os.environ.get("TRIAGE_EXCLUDED_SECTIONS", "").split(",") if s]
+# Chunks passed on to the final prompt
+RETRIEVAL_K = int(os.environ.get("TRIAGE_RETRIEVAL_K", "5"))
+# Optional cross-encoder rerank: over-fetch RERANK_CANDIDATES chunks and keep the
+# best RETRIEVAL_K; reranking is skipped when it takes longer than the budget
+RERANK_MODEL = os.environ.get("TRIAGE_RERANK_MODEL")
+RERANK_CANDIDATES = int(os.environ.get("TRIAGE_RERANK_CANDIDATES", "20"))
+RERANK_BUDGET = float(os.environ.get("TRIAGE_RERANK_BUDGET_MS", "300")) / 1000
+# Multi-query retrieval: the query stage lists the symptoms, each one is
+# searched (one batched search) and the rankings are merged by rank fusion
+MULTI_QUERY = os.environ.get("TRIAGE_MULTI_QUERY") == "1"
+MULTI_QUERY_PHRASES = int(os.environ.get("TRIAGE_MULTI_QUERY_PHRASES", "6"))
+MULTI_QUERY_CANDIDATES = 10  # chunks fetched per phrase
+# Directory of a sharded vector store (python rag/shards.py); unset uses the single index
+SHARDED_STORE = os.environ.get("TRIAGE_SHARDED_STORE")
+
+# Max tokens of retrieved medical context in the final prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("TRIAGE_CONTEXT_TOKENS", "600"))
+
+# End-to-end time budget of one request and the most each LLM stage may use;
+# when it runs out the final triage falls back to rag.fallback.degraded_triage
+REQUEST_DEADLINE = float(os.environ.get("TRIAGE_DEADLINE_SECONDS", "60"))
+STAGE_BUDGETS = {"question": 20.0, "query": 10.0, "final": 30.0}
+
+logger = logging.getLogger(__name__)
+
+# Thread pools of torch, FAISS and the tokenizers plus the CPU affinity of the
+# process (TRIAGE_TORCH_THREADS, TRIAGE_FAISS_THREADS, TRIAGE_CPU_AFFINITY, ...),
+# applied before the encoder and index are loaded
+thread_config = ThreadConfig.from_env()
+thread_errors = thread_config.apply()
+if thread_errors:
+    logger.warning("Thread settings not applied: %s", thread_errors)
+
+# Embedding cache for user texts: in-process LRU plus an optional tier shared
+# between workers (TRIAGE_EMBED_CACHE_REDIS wins over TRIAGE_EMBED_CACHE_PATH).
+# Keys carry the model name and TRIAGE_EMBED_CACHE_VERSION, bump the latter
+# when the weights behind EMBED_MODEL change
+if os.environ.get("TRIAGE_EMBED_CACHE_REDIS"):
+    shared_embeddings = RedisTier(os.environ["TRIAGE_EMBED_CACHE_REDIS"])
+elif os.environ.get("TRIAGE_EMBED_CACHE_PATH"):
+    shared_embeddings = SQLiteTier(os.environ["TRIAGE_EMBED_CACHE_PATH"])
+else:
+    shared_embeddings = None
+set_embedding_cache(EmbeddingCache(
+    max_items=int(os.environ.get("TRIAGE_EMBED_CACHE_SIZE", "10000")),
+    shared=shared_embeddings,
+    version=os.environ.get("TRIAGE_EMBED_CACHE_VERSION")
+))
+
+# Recorded vectors (TRIAGE_EMBED_FIXTURE, see rag/cassette.py) replace the cache;
+# when replaying, the encoder model is not loaded at all
+embedding_fixture = fixture_from_env()
+if embedding_fixture is not None:
+    set_embedding_cache(embedding_fixture)
+
+# LLM calls are queued by priority (likely emergencies first); when the queue
+# is full low priority requests are rejected straight away
+scheduler = LLMScheduler(
+    max_concurrent=int(os.environ.get("TRIAGE_LLM_CONCURRENCY", "4")),
+    max_queue=int(os.environ.get("TRIAGE_LLM_MAX_QUEUE", "32"))
+)
+
+# Model servers come from TRIAGE_LLM_BACKENDS (defaults to the local Ollama)
+# TRIAGE_LLM_CASSETTE records the calls to, or replays them instead of, those servers
+llm = client_from_env(lambda: LLMClient.from_env(default_model=LLM_MODEL, scheduler=scheduler),
+                      scheduler=scheduler)
+# Model per stage (question / query / final) and the optional small-model cascade
+tiers = ModelTiers.from_env()
+
+# Stop asking follow-up questions once retrieval over the answers is decisive
+stopping = StoppingPolicy.from_env()
+session_metrics = SessionMetrics()
+# LLM calls, tokens and stage timings of finished sessions (rag/accounting.py)
+usage_totals = UsageTotals()
+# Finished sessions appended to TRIAGE_OUTCOME_LOG by a writer thread, with an
+# optional periodic columnar export (rag/outcomes.py); unset disables it
+outcome_log = outcome_log_from_env()
+
+# The encoder, FAISS index and safety detector are loaded lazily / in the
+# background so the process can answer /healthz before they are ready
+startup = Startup(INDEX_PATH, DOCUMENTS_PATH, EMBED_MODEL, LLM_MODEL,
+                  excluded_sections=EXCLUDED_SECTIONS, llm_client=llm, sharded_store=SHARDED_STORE,
+                  rerank_model=RERANK_MODEL,
+                  load_encoder=not (embedding_fixture and embedding_fixture.mode == "replay"))
+
+
+@app.on_event("startup")
+def warm_up():
+    startup.start()
+    llm.start_health_checks()
+
+
+@app.on_event("shutdown")
+def flush_outcomes():
+    if outcome_log is not None:
+        outcome_log.flush()
 
 
 # Request/Response models
@@ -53,6 +181,16 @@ class SymptomRequest(BaseModel):
 class AnswerRequest(BaseModel):
     session_id: str
     answer: str
+    # number of answers the client has already sent, lets retries of a turn be told apart
+    turn: Optional[int] = None
+
+
+class ThreadSettings(BaseModel):
+    torch_threads: Optional[int] = None
+    torch_interop_threads: Optional[int] = None
+    faiss_threads: Optional[int] = None
+    tokenizers_parallelism: Optional[bool] = None
+    affinity: Optional[str] = None  # e.g. "0-3,8"
 
 
 class SessionResponse(BaseModel):
@@ -63,20 +201,6 @@ class SessionResponse(BaseModel):
     message: Optional[str] = None
 
 
-def build_context(retrieved_docs):
-    context = ""
-    for doc in retrieved_docs:
-        meta = doc["metadata"]
-        context += f"""
-        Condition: {meta['condition']}
-        Section: {meta['section']}
-        Urgency: {meta['urgency']}
-        Information: {doc['text']}
-        ---
-        """
-    return context.strip()
-
-
 def build_prompt(user_query, state: TriagState):
     return f"""
         You are a medical triage question generator.
@@ -134,6 +258,8 @@ def build_prompt(user_query, state: TriagState):
 
 
 def build_retrieval_query(state: TriagState):
+    if MULTI_QUERY:
+        return build_symptom_list_query(state)
     prompt = f"""
     You are a medical query generator.
 
@@ -149,6 +275,22 @@ def build_retrieval_query(state: TriagState):
     return prompt
 
 
+def build_symptom_list_query(state: TriagState):
+    return f"""
+    You are a medical query generator.
+
+    List the symptoms and findings from the conversation below as short
+    medical search phrases, separated by commas, e.g.
+    "severe headache, fever, stiff neck, rash".
+    Do not include the symptoms that are not present.
+
+    Conversation:
+    {state.build_memory()}
+
+    Output ONLY the comma separated list.
+    """
+
+
 def build_final_prompt(context, summary):
     return f"""
     You are a medical triage assistant.
@@ -190,33 +332,170 @@ def extract_json(text):
     return match.group(0) if match else None
 
 
+def parse_model_json(output):
+    match = extract_json(output)
+    if not match:
+        raise HTTPException(status_code=500, detail="No JSON found in model response")
+    try:
+        return json.loads(match)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=500, detail="Invalid JSON from model")
+
+
 def clean_query(text):
     return re.sub(r'[^a-zA-Z0-9 ,\-]', '', text).strip()
 
 
-def ask_llm(prompt):
-    response = ollama.chat(
-        model="qwen2.5:7b-instruct",
-        messages=[{"role": "user", "content": prompt}]
+def ask_llm(prompt, stage="final", deadline: Optional[Deadline] = None, on_token=None):
+    """Raises DeadlineExceeded when the stage can't finish within the request deadline"""
+    timeout = deadline.budget(stage) if deadline else None
+    try:
+        with stage_timer(stage):
+            response = tiers.ask(llm, prompt, stage, timeout=timeout, on_token=on_token)
+    except LLMTimeout as e:
+        raise DeadlineExceeded(str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except LLMError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return response["content"]
+
+
+def retrieve(query, phrases=None):
+    """
+    phrases: symptom phrases searched next to the query (multi-query retrieval).
+    Returns (documents, scores), scores are the rerank scores or None.
+    Search and rerank are timed as separate stages, so stage times add up.
+    """
+    with stage_timer("retrieval"):
+        candidates = search_candidates(query, phrases)
+
+    scores = None
+    if RERANK_MODEL:
+        with stage_timer("rerank"):
+            candidates, scores = rerank(query, candidates, len(candidates), RERANK_MODEL, time_budget=RERANK_BUDGET)
+    retrieved = filter_by_metadata(limit_per_condition(candidates, RETRIEVAL_K, MAX_CHUNKS_PER_CONDITION))
+    if scores is not None:
+        # the filters drop and reorder chunks, carry each chunk's score along
+        by_key = {doc_key(doc): score for doc, score in zip(candidates, scores)}
+        scores = [by_key[doc_key(doc)] for doc in retrieved]
+    return retrieved, scores
+
+
+def search_candidates(query, phrases=None):
+    phrases = [p for p in phrases or [] if p != query]
+    if phrases:
+        vectors = embed_texts([query] + phrases, EMBED_MODEL)
+    else:
+        vector = embedding(query, EMBED_MODEL)
+    # pin the index version, a reload swaps in a new one only for later searches
+    with startup.get("indexes").acquire() as active:
+        if phrases:
+            candidates = fuse_rankings(search_phrases(active, vectors))
+        elif SHARDED_STORE:
+            # fan out over the shards, over-fetching so sections can be filtered
+            candidates = active["index"].search_documents(vector, max(20, RERANK_CANDIDATES))
+            candidates = limit_per_condition(
+                candidates, len(candidates), len(candidates), EXCLUDED_SECTIONS or DEFAULT_EXCLUDED_SECTIONS
+            )
+        elif RERANK_MODEL:
+            candidates = active["conditions"].search(
+                vector, RERANK_CANDIDATES, top_conditions=TOP_CONDITIONS, max_per_condition=RERANK_CANDIDATES
+            )
+        else:
+            candidates = active["conditions"].search(
+                vector, RETRIEVAL_K, top_conditions=TOP_CONDITIONS, max_per_condition=MAX_CHUNKS_PER_CONDITION
+            )
+    return candidates
+
+
+def search_phrases(active, vectors):
+    """One batched search of all phrase vectors; a distance ranked chunk list per phrase."""
+    excluded = EXCLUDED_SECTIONS or DEFAULT_EXCLUDED_SECTIONS
+    if SHARDED_STORE:
+        hits = active["index"].search(vectors, MULTI_QUERY_CANDIDATES)
+        return [limit_per_condition([doc for _, doc in row], len(row), len(row), excluded) for row in hits]
+
+    docs, distances = search_batch(
+        vectors, MULTI_QUERY_CANDIDATES, active["index"], active["documents"], active["metadata"],
+        filters={"exclude_sections": excluded}, max_docs=MULTI_QUERY_CANDIDATES
     )
-    return response["message"]["content"]
+    # search_batch orders by urgency, fusion wants the distance order back
+    return [
+        [doc for _, doc in sorted(zip(row_distances, row_docs), key=lambda hit: hit[0])]
+        for row_docs, row_distances in zip(docs, distances)
+    ]
+
+
+def probe_retrieval(text):
+    """Cheap retrieval over the answers so far, for the stopping policy"""
+    vector = embedding(text, EMBED_MODEL)
+    with startup.get("indexes").acquire() as active:
+        if SHARDED_STORE:
+            hits = active["index"].search(vector, 20)[0]
+            return rank_conditions(hits), [doc for _, doc in hits[:RETRIEVAL_K]]
+
+        conditions = active["conditions"]
+        return (
+            conditions.search_conditions(vector, TOP_CONDITIONS),
+            conditions.search(vector, RETRIEVAL_K, top_conditions=TOP_CONDITIONS,
+                              max_per_condition=MAX_CHUNKS_PER_CONDITION)
+        )
+
+
+def stop_reason(state: TriagState):
+    """Why no further question should be asked, or None"""
+    asked = state.num_questions - 1  # the first turn is the complaint
+    if not stopping.wants_probe(asked):
+        return stopping.decide(asked)
+    with stage_timer("stop_probe"):
+        return stopping.decide(asked, *probe_retrieval(state.build_summary()))
 
 
-def perform_final_triage(state: TriagState):
+def set_question(session, question):
+    """Store the question waiting for an answer; question_id tells answers to different questions apart"""
+    session["last_question"] = question
+    session["question_id"] = session.get("question_id", 0) + 1
+
+
+def complete_session(session, triage_result, reason):
+    session["completed"] = True
+    session["result"] = triage_result
+    session["stop_reason"] = reason
+    state = session.get("state")
+    session_metrics.record(state.num_questions - 1 if state else 0, reason)
+
+
+def perform_final_triage(state: TriagState, deadline: Optional[Deadline] = None, session=None):
     """Perform final triage decision after collecting enough information"""
     retrieval_prompt = build_retrieval_query(state)
-    retrieval_query = ask_llm(retrieval_prompt).strip()
+    try:
+        retrieval_query = ask_llm(retrieval_prompt, stage="query", deadline=deadline).strip()
+    except DeadlineExceeded:
+        # no time to rewrite the query, search with the user's own words
+        retrieval_query = state.build_summary()
     clean_retrieval_query = clean_query(retrieval_query)
+    phrases = None
+    if MULTI_QUERY:
+        phrases = [clean_query(p) for p in split_symptoms(retrieval_query, MULTI_QUERY_PHRASES)]
     
-    vector = embedding(clean_retrieval_query, "all-MiniLM-L6-v2")
-    retrieved = find_similarity(vector, 5, index, documents)
-    retrieved = filter_by_metadata(retrieved)
+    retrieved, scores = retrieve(clean_retrieval_query, phrases)
+    if session is not None:
+        # kept for the outcome log
+        session["retrieval_query"] = clean_retrieval_query
+        session["retrieved"] = [doc_id(doc) for doc in retrieved]
     
-    context = build_context(retrieved)
+    # with rerank scores the budget goes to the best scored chunks of each urgency
+    context, context_tokens = build_context(retrieved, token_budget=CONTEXT_TOKEN_BUDGET, scores=scores)
+    logger.info("Final triage context: %d chunks, %d tokens", len(retrieved), context_tokens)
     summary = state.build_memory()
     
     final_prompt = build_final_prompt(context, summary)
-    final_output = ask_llm(final_prompt)
+    try:
+        final_output = ask_llm(final_prompt, stage="final", deadline=deadline)
+    except DeadlineExceeded:
+        logger.warning("Deadline exceeded, returning degraded triage")
+        return degraded_triage(retrieved)
     
     match = extract_json(final_output)
     if match:
@@ -232,16 +511,193 @@ def root():
     return {"message": "Medical Triage API", "status": "running"}
 
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up, components may still be loading"""
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: encoder, index and safety detector are loaded"""
+    report = startup.report()
+    if not startup.is_ready():
+        return JSONResponse(status_code=503, content=report)
+    return report
+
+
+@app.get("/api/llm/backends")
+def llm_backends():
+    """Health and load of each model server"""
+    return llm.status()
+
+
+@app.get("/api/cache/embeddings")
+def embedding_cache_stats():
+    """Hit rate of the user text embedding cache"""
+    return get_embedding_cache().stats()
+
+
+@app.get("/api/triage/metrics")
+def triage_metrics():
+    """Questions asked per finished session and stop reasons"""
+    return session_metrics.snapshot()
+
+
+@app.get("/api/admin/usage")
+def admin_usage():
+    """Cost of finished sessions, overall and per conversation pattern"""
+    report = usage_totals.snapshot()
+    per_session = report.get("per_session")
+    if per_session and per_session["llm_seconds"]:
+        # LLM time is the bottleneck: sessions one node can serve with every slot busy
+        report["estimated_capacity_per_hour"] = scheduler.max_concurrent * 3600 / per_session["llm_seconds"]
+    return report
+
+
+@app.get("/api/admin/outcomes")
+def admin_outcomes():
+    """State of the outcome log writer"""
+    if outcome_log is None:
+        raise HTTPException(status_code=404, detail="Outcome log disabled (set TRIAGE_OUTCOME_LOG)")
+    return outcome_log.stats()
+
+
+@app.get("/api/admin/index")
+def admin_index():
+    """Active vector store version, versions still draining and reload state"""
+    return startup.get("indexes").status()
+
+
+@app.post("/api/admin/index/reload", status_code=202)
+def admin_index_reload(force: bool = False):
+    """Load the vector store again in the background and swap it in when ready"""
+    indexes = startup.get("indexes")
+    started = indexes.reload_in_background(force)
+    return {"started": started, **indexes.status()}
+
+
+@app.get("/api/runtime/threads")
+def runtime_threads():
+    """Configured and effective thread / affinity settings"""
+    return {"configured": thread_config.as_dict(), "errors": thread_errors, "current": current_settings()}
+
+
+@app.post("/api/runtime/threads")
+def update_runtime_threads(settings: ThreadSettings):
+    """Change thread settings of this worker without a restart; unset fields are kept"""
+    update = ThreadConfig(**settings.dict(exclude_none=True))
+    errors = update.apply()
+    for name, value in update.as_dict().items():
+        if value is not None and name not in errors:
+            setattr(thread_config, name, value)
+    thread_errors.update(errors)
+    return runtime_threads()
+
+
+@app.get("/api/llm/scheduler")
+def llm_scheduler():
+    """Queue length and wait times per priority class"""
+    return scheduler.metrics()
+
+
+def run_turn(session_id, usage, fn):
+    """Run one request of a session with its cost accounted to usage"""
+    with session_turn(usage):
+        response = fn()
+
+    # a session that just finished goes into the totals, once
+    session = sessions.get(session_id)
+    if session is None or session["completed"]:
+        session_locks.discard(session_id)
+    if session is not None and session["completed"] and not session.get("accounted"):
+        session["accounted"] = True
+        state = session.get("state")
+        usage_totals.add(usage, state.num_questions - 1 if state else 0, session.get("stop_reason", "unknown"))
+        if outcome_log is not None:
+            outcome_log.log(outcome_record(session_id, session, usage))
+    return response
+
+
+def outcome_record(session_id, session, usage):
+    """What the outcome log keeps of a finished session"""
+    state = session.get("state")
+    result = session.get("result") or {}
+    report = usage.as_dict()
+    active = startup.get("indexes").status()["active"]
+    return {
+        "session_id": session_id,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "complaint": state.history[0][1] if state else session.get("complaint"),
+        "turns": [list(turn) for turn in state.history[1:]] if state else [],
+        "questions": state.num_questions - 1 if state else 0,
+        "stop_reason": session.get("stop_reason"),
+        "level": result.get("level"),
+        "confidence": result.get("confidence"),
+        "retrieval_query": session.get("retrieval_query"),
+        "retrieved": session.get("retrieved", []),
+        "seconds": report["seconds"],
+        "llm_calls": report["llm_calls"],
+        "prompt_tokens": report["prompt_tokens"],
+        "completion_tokens": report["completion_tokens"],
+        "stages": {name: values["seconds"] for name, values in report["stages"].items()},
+        "models": dict(usage.models),
+        "embed_model": EMBED_MODEL,
+        "index_version": active["version"] if active else None,
+    }
+
+
+def run_once(key, fn):
+    """Run fn once per key: replay a completed response or join an in-flight run."""
+    cached = completed_requests.get(key)
+    if cached is not None:
+        return cached
+
+    def run():
+        cached = completed_requests.get(key)
+        if cached is not None:
+            return cached
+        response = fn()
+        completed_requests.put(key, response)
+        return response
+
+    return in_flight.do(key, run)
+
+
 @app.post("/api/triage/start", response_model=SessionResponse)
-def start_triage(request: SymptomRequest):
+def start_triage(request: SymptomRequest, idempotency_key: Optional[str] = Header(None)):
     """Start a new triage session"""
+    return run_start(request, idempotency_key)
+
+
+def run_start(request: SymptomRequest, idempotency_key: Optional[str] = None, on_token=None):
+    """Shared by the HTTP and WebSocket APIs; on_token streams the question stage"""
     import uuid
-    
-    session_id = request.session_id or str(uuid.uuid4())
+
+    # without a client supplied key or session id two identical
+    # complaints may come from different people, so don't coalesce them
+    deadline = Deadline(REQUEST_DEADLINE, STAGE_BUDGETS)
+    usage = Usage()
+    if idempotency_key is None and request.session_id is None:
+        session_id = str(uuid.uuid4())
+        return run_turn(session_id, usage, lambda: _start_triage(request, session_id, deadline, on_token))
+
+    key = f"start:{idempotency_key or ''}:{request.session_id or ''}:{payload_hash(request.symptoms.strip())}"
+    session_id = request.session_id or str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+    def run():
+        with session_locks.get(session_id):
+            return run_turn(session_id, usage, lambda: _start_triage(request, session_id, deadline, on_token))
+
+    return run_once(key, run)
+
+
+def _start_triage(request: SymptomRequest, session_id: str, deadline: Deadline, on_token=None):
     user_query = request.symptoms.strip()
     
     # Check safety first
-    safety_level = safety.check(user_query)
+    with stage_timer("safety"):
+        safety_level, safety_score = startup.get("safety").assess(user_query)
     if safety_level:
         result = {
             "type": "triage",
@@ -253,8 +709,12 @@ def start_triage(request: SymptomRequest):
         sessions[session_id] = {
             "state": None,
             "completed": True,
-            "result": result
+            "result": result,
+            "stop_reason": "safety",
+            "complaint": user_query,
+            "usage": current_usage.get()
         }
+        session_metrics.record(0, "safety")
         return SessionResponse(
             session_id=session_id,
             type="triage",
@@ -262,29 +722,36 @@ def start_triage(request: SymptomRequest):
         )
     
     # Initialize state
-    state = TriagState()
+    state = TriagState(max_questions=stopping.max_questions + 1)
     state.add_turn("What are your symptoms?", user_query)
-    
-    # Get first question
-    prompt = build_prompt(user_query, state)
-    output = ask_llm(prompt)
-    match = extract_json(output)
-    
-    if match:
-        try:
-            result = json.loads(match)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Invalid JSON from model")
-    else:
-        raise HTTPException(status_code=500, detail="No JSON found in model response")
+
+    # LLM calls for this request are scheduled by how likely an emergency is
+    current_priority.set(priority_for(safety_score, count_red_flags(user_query, state.red_flags)))
     
     # Store session
     sessions[session_id] = {
         "state": state,
         "completed": False,
         "result": None,
-        "last_question": None
+        "last_question": None,
+        "question_id": 0,
+        "safety_score": safety_score,
+        "usage": current_usage.get()
     }
+
+    # Get first question, unless the complaint alone is decisive
+    reason = stop_reason(state)
+    if reason:
+        result = {"type": "stop", "confidence": 1.0}
+    else:
+        prompt = build_prompt(user_query, state)
+        try:
+            result = parse_model_json(ask_llm(prompt, stage="question", deadline=deadline, on_token=on_token))
+            reason = "llm_stop"
+        except DeadlineExceeded:
+            # out of time for questions, go straight to the final triage
+            result = {"type": "stop", "confidence": 1.0}
+            reason = "deadline"
     
     # Handle escalate case
     if result.get("type") == "escalate":
@@ -295,8 +762,7 @@ def start_triage(request: SymptomRequest):
             "what_to_do": [result.get("reason", "Seek immediate medical attention")],
             "watch_for": []
         }
-        sessions[session_id]["completed"] = True
-        sessions[session_id]["result"] = triage_result
+        complete_session(sessions[session_id], triage_result, "escalate")
         return SessionResponse(
             session_id=session_id,
             type="triage",
@@ -306,7 +772,7 @@ def start_triage(request: SymptomRequest):
     # Return question or stop
     if result.get("type") == "ask":
         # Store the question for the next answer
-        sessions[session_id]["last_question"] = result.get("question")
+        set_question(sessions[session_id], result.get("question"))
         return SessionResponse(
             session_id=session_id,
             type="ask",
@@ -314,9 +780,8 @@ def start_triage(request: SymptomRequest):
         )
     elif result.get("type") == "stop":
         # Perform final triage
-        triage_result = perform_final_triage(state)
-        sessions[session_id]["completed"] = True
-        sessions[session_id]["result"] = triage_result
+        triage_result = perform_final_triage(state, deadline, sessions[session_id])
+        complete_session(sessions[session_id], triage_result, reason)
         return SessionResponse(
             session_id=session_id,
             type="triage",
@@ -327,11 +792,35 @@ def start_triage(request: SymptomRequest):
 
 
 @app.post("/api/triage/answer", response_model=SessionResponse)
-def answer_question(request: AnswerRequest):
+def answer_question(request: AnswerRequest, idempotency_key: Optional[str] = Header(None)):
     """Answer a question in an ongoing triage session"""
+    return run_answer(request, idempotency_key)
+
+
+def run_answer(request: AnswerRequest, idempotency_key: Optional[str] = None, on_token=None):
+    """Shared by the HTTP and WebSocket APIs; on_token streams the question stage"""
     if request.session_id not in sessions:
         raise HTTPException(status_code=404, detail="Session not found")
-    
+
+    # the question this answer is for: it only changes once the next question
+    # is asked, so a retry sent while the first try is still running gets the
+    # same key and joins it
+    session = sessions[request.session_id]
+    question_id = session.get("question_id", 0)
+    turn = request.turn if request.turn is not None else f"q{question_id}"
+    key = f"answer:{request.session_id}:{idempotency_key or turn}:{payload_hash(request.answer.strip())}"
+    deadline = Deadline(REQUEST_DEADLINE, STAGE_BUDGETS)
+    usage = session.setdefault("usage", Usage())
+
+    def run():
+        with session_locks.get(request.session_id):
+            return run_turn(request.session_id, usage,
+                            lambda: _answer_question(request, deadline, on_token, question_id))
+
+    return run_once(key, run)
+
+
+def _answer_question(request: AnswerRequest, deadline: Deadline, on_token=None, question_id=None):
     session = sessions[request.session_id]
     if session["completed"]:
         return SessionResponse(
@@ -340,6 +829,9 @@ def answer_question(request: AnswerRequest):
             triage_result=session["result"],
             message="Session already completed"
         )
+    # another answer to the same question got the session lock first
+    if question_id is not None and session.get("question_id", 0) != question_id:
+        raise HTTPException(status_code=409, detail="Question already answered")
     
     state = session["state"]
     user_query = request.answer.strip()
@@ -348,20 +840,21 @@ def answer_question(request: AnswerRequest):
     if "last_question" in session and session["last_question"]:
         state.add_turn(session["last_question"], user_query)
         session["last_question"] = None  # Clear after using
+
+    red_flag_hits = count_red_flags(state.build_summary(), state.red_flags)
+    current_priority.set(priority_for(session.get("safety_score", 0.0), red_flag_hits))
     
-    # Continue questioning
-    if state.should_continue():
+    # Continue questioning unless the answers so far are decisive
+    reason = stop_reason(state)
+    if reason is None:
+        reason = "llm_stop"
         prompt = build_prompt(user_query, state)
-        output = ask_llm(prompt)
-        match = extract_json(output)
-        
-        if match:
-            try:
-                result = json.loads(match)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=500, detail="Invalid JSON from model")
-        else:
-            raise HTTPException(status_code=500, detail="No JSON found in model response")
+        try:
+            result = parse_model_json(ask_llm(prompt, stage="question", deadline=deadline, on_token=on_token))
+        except DeadlineExceeded:
+            # out of time for more questions, go straight to the final triage
+            result = {"type": "stop", "confidence": 1.0}
+            reason = "deadline"
         
         # Handle escalate
         if result.get("type") == "escalate":
@@ -372,8 +865,7 @@ def answer_question(request: AnswerRequest):
                 "what_to_do": [result.get("reason", "Seek immediate medical attention")],
                 "watch_for": []
             }
-            session["completed"] = True
-            session["result"] = triage_result
+            complete_session(session, triage_result, "escalate")
             return SessionResponse(
                 session_id=request.session_id,
                 type="triage",
@@ -383,7 +875,7 @@ def answer_question(request: AnswerRequest):
         # Handle ask
         if result.get("type") == "ask":
             question = result.get("question")
-            session["last_question"] = question  # Store for next answer
+            set_question(session, question)  # Store for next answer
             return SessionResponse(
                 session_id=request.session_id,
                 type="ask",
@@ -395,9 +887,8 @@ def answer_question(request: AnswerRequest):
             confidence = result.get("confidence", 0.5)
             if confidence >= CONFIDENCE_THRESHOLD:
                 # Perform final triage
-                triage_result = perform_final_triage(state)
-                session["completed"] = True
-                session["result"] = triage_result
+                triage_result = perform_final_triage(state, deadline, session)
+                complete_session(session, triage_result, reason)
                 return SessionResponse(
                     session_id=request.session_id,
                     type="triage",
@@ -405,9 +896,8 @@ def answer_question(request: AnswerRequest):
                 )
     
     # Max questions reached or stop condition
-    triage_result = perform_final_triage(state)
-    session["completed"] = True
-    session["result"] = triage_result
+    triage_result = perform_final_triage(state, deadline, session)
+    complete_session(session, triage_result, reason)
     return SessionResponse(
         session_id=request.session_id,
         type="triage",
@@ -428,10 +918,99 @@ def get_session(session_id: str):
         "session_id": session_id,
         "completed": session["completed"],
         "result": session["result"],
-        "history": state.build_memory() if state else None
+        "history": state.build_memory() if state else None,
+        "usage": session["usage"].as_dict() if session.get("usage") else None
     }
 
 
+def resume_session(session_id: str):
+    """Current step of a session: its result, or the question waiting for an answer"""
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    session = sessions[session_id]
+    if session["completed"]:
+        return SessionResponse(session_id=session_id, type="triage", triage_result=session["result"])
+    if session.get("last_question"):
+        return SessionResponse(session_id=session_id, type="ask", question=session["last_question"])
+    # a turn is still being processed, its reply goes to whoever sent it
+    return SessionResponse(session_id=session_id, type="pending")
+
+
+def handle_socket_message(message, on_token):
+    """Run one client message of the WebSocket protocol, returns the reply dict"""
+    kind = message.get("type")
+    if kind == "start":
+        response = run_start(SymptomRequest(symptoms=message["symptoms"], session_id=message.get("session_id")),
+                             message.get("idempotency_key"), on_token)
+    elif kind == "answer":
+        response = run_answer(AnswerRequest(session_id=message["session_id"], answer=message["answer"],
+                                            turn=message.get("turn")),
+                              message.get("idempotency_key"), on_token)
+    elif kind == "resume":
+        response = resume_session(message["session_id"])
+    else:
+        raise HTTPException(status_code=400, detail=f"Unknown message type: {kind}")
+    return jsonable_encoder(response)
+
+
+@app.websocket("/ws/triage")
+async def triage_socket(websocket: WebSocket):
+    """
+    One connection per triage conversation. The client sends
+    {"type": "start" | "answer" | "resume", ...} with the same fields as the
+    HTTP API and gets {"type": "token", "text": ...} events while the next
+    question is generated, then the SessionResponse. After a reconnect,
+    "resume" returns the pending question or the result of the session.
+    """
+    await websocket.accept()
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            # a frame that isn't a JSON object gets the same error as any other bad message
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError as e:
+                await websocket.send_json({"type": "error", "status": 422, "detail": f"Invalid message: {e}"})
+                continue
+            if not isinstance(message, dict):
+                await websocket.send_json({"type": "error", "status": 422,
+                                           "detail": "Invalid message: expected a JSON object"})
+                continue
+            events = asyncio.Queue()
+
+            def push(event):
+                loop.call_soon_threadsafe(events.put_nowait, event)
+
+            question = FieldStream("question", lambda text: push({"type": "token", "text": text}))
+
+            def run():
+                try:
+                    return handle_socket_message(message, question.feed)
+                finally:
+                    push(None)
+
+            # the turn runs in the threadpool like the HTTP endpoints, tokens
+            # are forwarded while it generates
+            work = asyncio.ensure_future(run_in_threadpool(run))
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                await websocket.send_json(event)
+
+            try:
+                reply = await work
+            except HTTPException as e:
+                reply = {"type": "error", "status": e.status_code, "detail": e.detail}
+            except (KeyError, ValidationError) as e:
+                reply = {"type": "error", "status": 422, "detail": f"Invalid message: {e}"}
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        # the session stays in the store, the client can reconnect and resume
+        pass
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
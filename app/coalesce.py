@@ -0,0 +1,102 @@
+import hashlib
+import threading
+import time
+
+
+def payload_hash(*parts):
+    return hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:16]
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Duplicate concurrent calls with the same key wait for the first one and
+    share its result (or exception) instead of running the work again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class IdempotencyStore:
+    """Completed responses by idempotency key, kept for ttl seconds."""
+
+    def __init__(self, ttl=600.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._items[key]
+                return None
+            return value
+
+    def put(self, key, value):
+        now = time.monotonic()
+        with self._lock:
+            self._items[key] = (now + self.ttl, value)
+            # drop expired entries now and then so the dict doesn't grow forever
+            if len(self._items) % 256 == 0:
+                for k in [k for k, (expires, _) in self._items.items() if expires < now]:
+                    del self._items[k]
+
+
+class SessionLocks:
+    """One lock per session so turns of a session are applied one at a time."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def get(self, session_id):
+        with self._lock:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.Lock()
+            return lock
+
+    def discard(self, session_id):
+        """Forget the lock of a finished session; holders of it are unaffected"""
+        with self._lock:
+            self._locks.pop(session_id, None)
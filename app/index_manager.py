@@ -0,0 +1,189 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class IndexVersion:
+    """One loaded version of the vector store and what is built from it."""
+
+    def __init__(self, components, fingerprint, version=None, load_seconds=0.0):
+        self.components = components
+        self.fingerprint = fingerprint
+        self.version = version or fingerprint[:12]
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.refs = 0
+        self.retired = False
+
+    def __getitem__(self, name):
+        return self.components[name]
+
+    def info(self):
+        return {
+            "version": self.version,
+            "loaded_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.loaded_at)),
+            "load_seconds": round(self.load_seconds, 3),
+            "in_use": self.refs,
+        }
+
+
+class IndexManager:
+    """
+    Holds the active index version and swaps in new ones without a restart.
+
+    Searches run inside acquire(), which pins the version that was active
+    when they started; reload() loads the new version in the caller's thread
+    (a background thread for the watcher and the admin endpoint), swaps it
+    in atomically and releases the old one once its last search finishes.
+
+    paths are the files whose change means a new version (the single index
+    and its documents, or a sharded store's manifest.json). The watcher only
+    reloads once a change has been stable for one poll, so a store that is
+    still being written is not picked up half way, and a version that
+    failed to load is not tried again until the files change once more.
+    """
+
+    def __init__(self, load_fn, paths, poll_interval=0):
+        self.load_fn = load_fn
+        self.paths = [Path(p) for p in paths]
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._active = None
+        self._draining = []
+        self._watch_thread = None
+
+        self.reloads = 0
+        self.last_error = None
+        self.last_check = None
+
+    def fingerprint(self):
+        digest = hashlib.sha1()
+        for path in self.paths:
+            stat = path.stat()
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _version_name(self, fingerprint):
+        # a manifest may name its version, e.g. {"version": "2024-06-03", ...}
+        for path in self.paths:
+            if path.suffix == ".json" and path.name.startswith("manifest"):
+                try:
+                    with open(path, "r") as f:
+                        return json.load(f).get("version")
+                except (OSError, ValueError):
+                    return None
+        return None
+
+    def reload(self, force=False):
+        """Load the store again if it changed (or force). Returns True when a new version was swapped in."""
+        with self._reload_lock:
+            fingerprint = self.fingerprint()
+            if not force and self._active is not None and fingerprint == self._active.fingerprint:
+                return False
+
+            start = time.perf_counter()
+            try:
+                components = self.load_fn()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Index reload failed, keeping version %s",
+                                 self._active.version if self._active else None)
+                raise
+            new = IndexVersion(components, fingerprint, self._version_name(fingerprint),
+                               time.perf_counter() - start)
+
+            with self._lock:
+                old = self._active
+                self._active = new
+                if old is not None:
+                    old.retired = True
+                    if old.refs == 0:
+                        self._release(old)
+                    else:
+                        self._draining.append(old)
+            self.reloads += 1
+            self.last_error = None
+            logger.info("Index version %s active (loaded in %.2fs)", new.version, new.load_seconds)
+            return True
+
+    def reload_in_background(self, force=False):
+        """Start a reload thread; returns False if a reload is already running."""
+        if self._reload_lock.locked():
+            return False
+
+        def run():
+            try:
+                self.reload(force)
+            except Exception:
+                pass  # logged and kept in last_error
+
+        threading.Thread(target=run, name="index-reload", daemon=True).start()
+        return True
+
+    @contextmanager
+    def acquire(self):
+        """Pin the active version for the duration of a search."""
+        with self._lock:
+            version = self._active
+            if version is None:
+                raise RuntimeError("No index loaded")
+            version.refs += 1
+        try:
+            yield version
+        finally:
+            with self._lock:
+                version.refs -= 1
+                if version.retired and version.refs == 0 and version in self._draining:
+                    self._draining.remove(version)
+                    self._release(version)
+
+    def _release(self, version):
+        # called with _lock held once nothing searches the version any more
+        for component in version.components.values():
+            close = getattr(component, "close", None)
+            if close is not None:
+                close()
+        version.components = {}
+        logger.info("Index version %s released", version.version)
+
+    def _watch(self):
+        seen = None
+        failed = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                fingerprint = self.fingerprint()
+            except OSError:
+                continue  # files are being replaced
+            self.last_check = time.time()
+            if fingerprint != self._active.fingerprint and fingerprint == seen and fingerprint != failed:
+                try:
+                    self.reload()
+                except Exception:
+                    failed = fingerprint  # logged and kept in last_error, retried on the next change
+            seen = fingerprint
+
+    def start_watching(self):
+        if self.poll_interval and self._watch_thread is None:
+            self._watch_thread = threading.Thread(target=self._watch, name="index-watch", daemon=True)
+            self._watch_thread.start()
+
+    def status(self):
+        with self._lock:
+            return {
+                "active": self._active.info() if self._active else None,
+                "draining": [v.info() for v in self._draining],
+                "reloading": self._reload_lock.locked(),
+                "reloads": self.reloads,
+                "watching": [str(p) for p in self.paths] if self._watch_thread else [],
+                "poll_interval": self.poll_interval,
+                "last_error": self.last_error,
+            }
@@ -0,0 +1,219 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# lazy: load on first request, background: warm in a thread after the app
+# starts (default), eager: block server startup until everything is loaded
+STARTUP_MODE = os.environ.get("TRIAGE_STARTUP_MODE", "background")
+# seconds between checks of the vector store files for a new version, 0 disables
+INDEX_POLL_SECONDS = float(os.environ.get("TRIAGE_INDEX_POLL_SECONDS", "30"))
+
+
+class Startup:
+    """
+    Holds the heavy components of the API (encoder, FAISS index, documents,
+    safety detector) behind a readiness state so the process can answer
+    /healthz straight away and load everything else lazily or in the background.
+    """
+
+    def __init__(self, index_path, documents_path, embed_model, llm_model,
+                 safety_threshold=0.85, ping_llm=True, excluded_sections=None, llm_client=None,
+                 sharded_store=None, rerank_model=None, load_encoder=True):
+        self.index_path = index_path
+        self.documents_path = documents_path
+        self.embed_model = embed_model
+        self.llm_model = llm_model
+        self.safety_threshold = safety_threshold
+        self.ping_llm = ping_llm
+        self.excluded_sections = excluded_sections
+        self.llm_client = llm_client
+        # directory with a manifest.json built by rag/shards.py, replaces the single index
+        self.sharded_store = sharded_store
+        # optional cross-encoder, loaded up front so the first rerank stays in budget
+        self.rerank_model = rerank_model
+        # False when embeddings are replayed from a fixture (rag/cassette.py)
+        self.load_encoder = load_encoder
+
+        self.status = "starting"
+        self.error = None
+        self.warnings = []
+        self.timings = {}
+        self.components = {}
+        self.tokenizer = None
+
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = None
+        self._created = time.perf_counter()
+
+    def _timed(self, name, fn):
+        start = time.perf_counter()
+        value = fn()
+        self.timings[name] = round(time.perf_counter() - start, 3)
+        return value
+
+    def _load_encoder(self):
+        from rag.retriever import get_model
+        return get_model(self.embed_model)
+
+    def _load_index(self):
+        if self.sharded_store:
+            # every shard is read before the version is swapped in, so
+            # the first searches after a reload don't pay for the disk reads
+            from rag.shards import ShardedIndex
+            index = ShardedIndex(self.sharded_store)
+            index.load_all()
+            return index, None
+
+        from rag.retriever import loader
+        return loader(self.index_path, self.documents_path)
+
+    def _build_conditions(self, index, documents):
+        from rag.condition_index import ConditionIndex, EXCLUDED_SECTIONS
+        return ConditionIndex(index, documents, self.excluded_sections or EXCLUDED_SECTIONS)
+
+    def _encode_metadata(self, documents):
+        # integer coded urgency / condition / section arrays for retriever.search_batch
+        from rag.retriever import encode_metadata
+        return encode_metadata(documents)
+
+    def _load_index_version(self):
+        """Everything built from the vector store; reloaded together by the IndexManager."""
+        index, documents = self._load_index()
+        components = {"index": index, "documents": documents, "conditions": None, "metadata": None}
+        if documents is not None:
+            components["conditions"] = self._build_conditions(index, documents)
+            components["metadata"] = self._encode_metadata(documents)
+        return components
+
+    def _index_paths(self):
+        if self.sharded_store:
+            from rag.shards import MANIFEST_NAME
+            return [os.path.join(self.sharded_store, MANIFEST_NAME)]
+        return [self.index_path, self.documents_path]
+
+    def _load_indexes(self):
+        from app.index_manager import IndexManager
+        indexes = IndexManager(self._load_index_version, self._index_paths(), INDEX_POLL_SECONDS)
+        indexes.reload(force=True)
+        return indexes
+
+    def _build_safety(self):
+        from rag.concepts import load_concept_matrix
+        from rag.retriever import embedding, get_model
+        from rag.safety import SafetyDetector
+
+        # precomputed by the indexing step, rebuilt here only if stale
+        matrix, levels = load_concept_matrix(
+            self.embed_model,
+            encode_fn=lambda texts: get_model(self.embed_model).encode(texts, convert_to_numpy=True)
+        )
+        return SafetyDetector(
+            embed_fn=lambda t: embedding(t, self.embed_model),
+            threshold=self.safety_threshold,
+            concept_matrix=matrix,
+            concept_levels=levels
+        )
+
+    def _load_reranker(self):
+        from rag.retriever import get_cross_encoder
+        encoder = get_cross_encoder(self.rerank_model)
+        encoder.predict([("warm up", "warm up")])
+        return encoder
+
+    def _load_tokenizer(self):
+        # used by the context builder to count prompt tokens
+        from rag.context import get_tokenizer, tokenizer_name, TOKENIZER_NAME
+        tokenizer = get_tokenizer()
+        self.tokenizer = tokenizer_name(tokenizer)
+        if self.tokenizer != TOKENIZER_NAME:
+            self.warnings.append(f"Tokenizer {TOKENIZER_NAME} unavailable, context budget uses {self.tokenizer}")
+        return tokenizer
+
+    def _ping_llm(self):
+        # a one token generation forces the server to load the model into memory
+        if self.llm_client is None:
+            from rag.llm import LLMClient
+            self.llm_client = LLMClient.from_env(default_model=self.llm_model)
+        self.llm_client.chat("ping", max_tokens=1)
+
+    def load(self):
+        """Load every component once; safe to call from several threads."""
+        if self._ready.is_set():
+            return self.components
+
+        with self._lock:
+            if self._ready.is_set():
+                return self.components
+
+            self.status = "warming"
+            try:
+                if self.load_encoder:
+                    encoder = self._timed("encoder", self._load_encoder)
+                    self._timed("dummy_encode", lambda: encoder.encode(["warm up"], convert_to_numpy=True))
+                indexes = self._timed("index", self._load_indexes)
+                safety = self._timed("safety", self._build_safety)
+                self._timed("tokenizer", self._load_tokenizer)
+                if self.rerank_model:
+                    self._timed("reranker", self._load_reranker)
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                logger.exception("Startup failed")
+                raise
+
+            if self.ping_llm:
+                try:
+                    self._timed("llm_ping", self._ping_llm)
+                except Exception as e:
+                    # the LLM server may come up after us, so this is not fatal
+                    self.warnings.append(f"LLM warm-up failed: {e}")
+
+            # index, documents, conditions and metadata live in the versioned
+            # IndexManager so they can be swapped without a restart
+            indexes.start_watching()
+            self.components = {
+                "indexes": indexes,
+                "safety": safety,
+            }
+            self.timings["total"] = round(time.perf_counter() - self._created, 3)
+            self.status = "ready"
+            self._ready.set()
+            logger.info("Startup finished: %s", self.timings)
+
+        return self.components
+
+    def _warm(self):
+        try:
+            self.load()
+        except Exception:
+            pass
+
+    def start(self, mode=STARTUP_MODE):
+        """Called from the app startup hook."""
+        if mode == "eager":
+            self.load()
+        elif mode == "background" and self._thread is None:
+            self._thread = threading.Thread(target=self._warm, name="triage-warmup", daemon=True)
+            self._thread.start()
+
+    def get(self, name):
+        """Return a component, loading (or waiting for) everything if needed."""
+        return self.load()[name]
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def report(self):
+        return {
+            "status": self.status,
+            "mode": STARTUP_MODE,
+            "timings": self.timings,
+            "warnings": self.warnings,
+            "error": self.error,
+            "tokenizer": self.tokenizer,
+            "index": self.components["indexes"].status() if self.components else None,
+        }
@@ -0,0 +1,59 @@
+import re
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+class FieldStream:
+    """
+    Picks one string field out of a JSON reply while it is being generated,
+    so e.g. the "question" of the question stage can be shown token by token
+    while the rest of the JSON (type, reason, ...) is hidden.
+
+    feed() takes raw model text and calls emit(text) with the newly decoded
+    characters of the field value.
+    """
+
+    def __init__(self, field, emit):
+        self.emit = emit
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buffer = ""
+        self._pos = None     # index in _buffer of the next undecoded value char
+        self._done = False
+
+    def feed(self, text):
+        if self._done:
+            return
+        self._buffer += text
+        if self._pos is None:
+            match = self._start.search(self._buffer)
+            if not match:
+                return
+            self._pos = match.end()
+
+        decoded = []
+        buffer = self._buffer
+        i = self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self._done = True
+                break
+            if char == "\\":
+                # wait for the rest of an escape split across pieces
+                if i + 1 >= len(buffer):
+                    break
+                if buffer[i + 1] == "u":
+                    if i + 6 > len(buffer):
+                        break
+                    decoded.append(chr(int(buffer[i + 2:i + 6], 16)))
+                    i += 6
+                    continue
+                decoded.append(ESCAPES.get(buffer[i + 1], buffer[i + 1]))
+                i += 2
+                continue
+            decoded.append(char)
+            i += 1
+
+        self._pos = i
+        if decoded:
+            self.emit("".join(decoded))
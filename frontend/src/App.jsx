@@ -1,10 +1,11 @@
-import { useState } from 'react'
+import { useEffect, useRef, useState } from 'react'
 import axios from 'axios'
 import ChatMessage from './components/ChatMessage'
 import TriageResult from './components/TriageResult'
 import InputForm from './components/InputForm'
 
 const API_BASE_URL = 'http://localhost:8000'
+const WS_URL = `${API_BASE_URL.replace(/^http/, 'ws')}/ws/triage`
 
 function App() {
   const [sessionId, setSessionId] = useState(null)
@@ -13,6 +14,91 @@ function App() {
   const [triageResult, setTriageResult] = useState(null)
   const [loading, setLoading] = useState(false)
   const [error, setError] = useState(null)
+  const [turn, setTurn] = useState(0)
+  // session id chosen up front so a double submit or retry joins the same session on the server
+  const pendingSessionId = useRef(crypto.randomUUID())
+  // the question as it is being generated, streamed over the WebSocket
+  const [streamingQuestion, setStreamingQuestion] = useState('')
+  const socketRef = useRef(null)
+  const pendingRequest = useRef(null)
+  const sessionIdRef = useRef(null)
+
+  const showResponse = (data) => {
+    if (data.type === 'triage') {
+      setCurrentQuestion(null)
+      setTriageResult(data.triage_result)
+    } else if (data.type === 'ask') {
+      setCurrentQuestion(data.question)
+      // a resume may repeat the question that is already shown
+      setMessages(prev => {
+        const last = prev[prev.length - 1]
+        if (last && last.type === 'assistant' && last.content === data.question) return prev
+        return [...prev, { type: 'assistant', content: data.question }]
+      })
+    }
+  }
+
+  useEffect(() => {
+    let closed = false
+    let retry = null
+
+    const connect = () => {
+      const socket = new WebSocket(WS_URL)
+      socket.onopen = () => {
+        socketRef.current = socket
+        // after a reconnect, pick the session up where the server has it
+        if (sessionIdRef.current) {
+          pendingRequest.current = { resolve: showResponse, reject: () => {} }
+          socket.send(JSON.stringify({ type: 'resume', session_id: sessionIdRef.current }))
+        }
+      }
+      socket.onmessage = (event) => {
+        const data = JSON.parse(event.data)
+        if (data.type === 'token') {
+          setStreamingQuestion(prev => prev + data.text)
+          return
+        }
+        setStreamingQuestion('')
+        const pending = pendingRequest.current
+        if (pending) {
+          pendingRequest.current = null
+          data.type === 'error' ? pending.reject(data) : pending.resolve(data)
+        }
+      }
+      socket.onclose = () => {
+        socketRef.current = null
+        setStreamingQuestion('')
+        if (pendingRequest.current) {
+          pendingRequest.current.reject({ lost: true })
+          pendingRequest.current = null
+        }
+        if (!closed) retry = setTimeout(connect, 1000)
+      }
+    }
+
+    connect()
+    return () => {
+      closed = true
+      clearTimeout(retry)
+      if (socketRef.current) socketRef.current.close()
+    }
+  }, [])
+
+  // Send over the WebSocket when it is open, otherwise (or if the connection
+  // drops mid-turn) over HTTP. The server coalesces both into one run.
+  const send = (message, httpCall) => {
+    const socket = socketRef.current
+    if (!socket || socket.readyState !== WebSocket.OPEN || pendingRequest.current) {
+      return httpCall()
+    }
+    return new Promise((resolve, reject) => {
+      pendingRequest.current = { resolve, reject }
+      socket.send(JSON.stringify(message))
+    }).catch(err => (err.lost ? httpCall() : Promise.reject(err)))
+  }
+
+  const errorMessage = (err) =>
+    err.response?.data?.detail || err.detail || 'An error occurred. Please try again.'
 
   const startTriage = async (symptoms) => {
     setLoading(true)
@@ -20,31 +106,26 @@ function App() {
     setMessages([])
     setTriageResult(null)
     setCurrentQuestion(null)
+    setTurn(0)
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/api/triage/start`, {
-        symptoms: symptoms,
-      })
-
-      const data = response.data
-      setSessionId(data.session_id)
-
       // Add initial user message
       setMessages([{ type: 'user', content: symptoms }])
+      sessionIdRef.current = pendingSessionId.current
 
-      if (data.type === 'triage') {
-        // Immediate triage result
-        setTriageResult(data.triage_result)
-      } else if (data.type === 'ask') {
-        // Question received
-        setCurrentQuestion(data.question)
-        setMessages(prev => [
-          ...prev,
-          { type: 'assistant', content: data.question }
-        ])
-      }
+      const data = await send(
+        { type: 'start', symptoms: symptoms, session_id: pendingSessionId.current },
+        async () => (await axios.post(`${API_BASE_URL}/api/triage/start`, {
+          symptoms: symptoms,
+          session_id: pendingSessionId.current,
+        })).data
+      )
+      setSessionId(data.session_id)
+
+      // Immediate triage result or the first question
+      showResponse(data)
     } catch (err) {
-      setError(err.response?.data?.detail || 'An error occurred. Please try again.')
+      setError(errorMessage(err))
       console.error('Error starting triage:', err)
     } finally {
       setLoading(false)
@@ -64,27 +145,21 @@ function App() {
         { type: 'user', content: answer }
       ])
 
-      const response = await axios.post(`${API_BASE_URL}/api/triage/answer`, {
-        session_id: sessionId,
-        answer: answer,
-      })
-
-      const data = response.data
+      const data = await send(
+        { type: 'answer', session_id: sessionId, answer: answer, turn: turn },
+        async () => (await axios.post(`${API_BASE_URL}/api/triage/answer`, {
+          session_id: sessionId,
+          answer: answer,
+          turn: turn,
+        })).data
+      )
+      setTurn(prev => prev + 1)
       setCurrentQuestion(null)
 
-      if (data.type === 'triage') {
-        // Final triage result
-        setTriageResult(data.triage_result)
-      } else if (data.type === 'ask') {
-        // Another question
-        setCurrentQuestion(data.question)
-        setMessages(prev => [
-          ...prev,
-          { type: 'assistant', content: data.question }
-        ])
-      }
+      // Final triage result or another question
+      showResponse(data)
     } catch (err) {
-      setError(err.response?.data?.detail || 'An error occurred. Please try again.')
+      setError(errorMessage(err))
       console.error('Error submitting answer:', err)
     } finally {
       setLoading(false)
@@ -97,6 +172,10 @@ function App() {
     setCurrentQuestion(null)
     setTriageResult(null)
     setError(null)
+    setTurn(0)
+    setStreamingQuestion('')
+    sessionIdRef.current = null
+    pendingSessionId.current = crypto.randomUUID()
   }
 
   return (
@@ -146,6 +225,9 @@ function App() {
               {messages.map((msg, idx) => (
                 <ChatMessage key={idx} type={msg.type} content={msg.content} />
               ))}
+              {streamingQuestion && (
+                <ChatMessage type="assistant" content={streamingQuestion} />
+              )}
             </div>
           </div>
         )}
@@ -0,0 +1,165 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Usage record of the session the current request belongs to; set by the API,
+# read by LLMClient, the embedding cache and the stage timers
+current_usage = ContextVar("current_usage", default=None)
+
+
+class Usage:
+    """Cost of one session: LLM calls and tokens, time per stage, cache hits."""
+
+    def __init__(self):
+        self.turns = 0
+        self.seconds = 0.0
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.llm_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.stages = {}    # name -> {"calls", "seconds", "llm_calls", "prompt_tokens", "completion_tokens"}
+        self.models = {}    # stage -> model that answered its last LLM call
+        self._stage = None
+
+    def _stage_entry(self, name):
+        return self.stages.setdefault(
+            name, {"calls": 0, "seconds": 0.0, "llm_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        )
+
+    def add_llm_call(self, response):
+        self.llm_calls += 1
+        self.prompt_tokens += response.get("prompt_tokens", 0)
+        self.completion_tokens += response.get("completion_tokens", 0)
+        self.llm_seconds += response.get("latency", 0.0)
+        if response.get("model"):
+            self.models[self._stage or "llm"] = response["model"]
+        if self._stage is not None:
+            entry = self._stage_entry(self._stage)
+            entry["llm_calls"] += 1
+            entry["prompt_tokens"] += response.get("prompt_tokens", 0)
+            entry["completion_tokens"] += response.get("completion_tokens", 0)
+
+    def add_stage(self, name, seconds):
+        entry = self._stage_entry(name)
+        entry["calls"] += 1
+        entry["seconds"] += seconds
+
+    def merge(self, other):
+        for name in ("turns", "seconds", "llm_calls", "prompt_tokens", "completion_tokens",
+                     "llm_seconds", "cache_hits", "cache_misses"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        for name, values in other.stages.items():
+            entry = self._stage_entry(name)
+            for key, value in values.items():
+                entry[key] += value
+
+    def as_dict(self):
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "turns": self.turns,
+            "seconds": round(self.seconds, 3),
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "llm_seconds": round(self.llm_seconds, 3),
+            "embedding_cache": {"hits": self.cache_hits, "misses": self.cache_misses,
+                                "hit_rate": self.cache_hits / lookups if lookups else 0.0},
+            "stages": {name: {k: round(v, 3) if isinstance(v, float) else v for k, v in values.items()}
+                       for name, values in self.stages.items()},
+        }
+
+
+@contextmanager
+def session_turn(usage):
+    """Attribute everything done in this block (one request) to usage."""
+    token = current_usage.set(usage)
+    start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        usage.turns += 1
+        usage.seconds += time.perf_counter() - start
+        current_usage.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage (question, query, final, retrieval, ...) of the current session."""
+    usage = current_usage.get()
+    if usage is None:
+        yield
+        return
+
+    previous = usage._stage
+    usage._stage = name
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        usage.add_stage(name, time.perf_counter() - start)
+        usage._stage = previous
+
+
+def record_llm_call(response):
+    usage = current_usage.get()
+    if usage is not None:
+        usage.add_llm_call(response)
+
+
+def record_cache(hits, misses):
+    usage = current_usage.get()
+    if usage is not None:
+        usage.cache_hits += hits
+        usage.cache_misses += misses
+
+
+class UsageTotals:
+    """
+    Usage of finished sessions, overall and per conversation pattern
+    (questions asked + stop reason), for capacity estimates.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.total = Usage()
+        self.sessions = 0
+        self.patterns = {}   # "2 questions / max_questions" -> [sessions, Usage]
+
+    def add(self, usage, questions_asked, reason):
+        pattern = f"{questions_asked} questions / {reason}"
+        with self._lock:
+            self.sessions += 1
+            self.total.merge(usage)
+            entry = self.patterns.setdefault(pattern, [0, Usage()])
+            entry[0] += 1
+            entry[1].merge(usage)
+
+    @staticmethod
+    def _per_session(usage, sessions):
+        return {
+            "llm_calls": usage.llm_calls / sessions,
+            "prompt_tokens": usage.prompt_tokens / sessions,
+            "completion_tokens": usage.completion_tokens / sessions,
+            "llm_seconds": usage.llm_seconds / sessions,
+            "seconds": usage.seconds / sessions,
+        }
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.time() - self._started
+            report = {
+                "sessions": self.sessions,
+                "uptime_seconds": round(uptime, 1),
+                "sessions_per_hour": self.sessions / uptime * 3600 if uptime else 0.0,
+                "total": self.total.as_dict(),
+                "patterns": {},
+            }
+            if self.sessions:
+                report["per_session"] = self._per_session(self.total, self.sessions)
+            for pattern, (sessions, usage) in sorted(self.patterns.items()):
+                report["patterns"][pattern] = {"sessions": sessions, **self._per_session(usage, sessions)}
+            return report
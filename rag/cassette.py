@@ -0,0 +1,222 @@
+"""
+Record / replay of LLM calls and embeddings, so the non-LLM parts of the
+pipeline can be profiled, benchmarked and load tested without a model server.
+
+    # record a session against the real Ollama
+    TRIAGE_CASSETTE_MODE=record TRIAGE_LLM_CASSETTE=cassettes/llm.jsonl \\
+        TRIAGE_EMBED_FIXTURE=cassettes/vectors.db uvicorn app.api:app
+    # replay it anywhere, with the recorded LLM latencies
+    TRIAGE_LLM_CASSETTE=cassettes/llm.jsonl TRIAGE_EMBED_FIXTURE=cassettes/vectors.db \\
+        TRIAGE_CASSETTE_LATENCY=1 uvicorn app.api:app
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+from rag.embed_cache import SQLiteTier, cache_key, normalize_text
+from rag.accounting import record_llm_call
+from rag.llm import LLMError, LLMTimeout
+
+
+def prompt_key(prompt, model=None, max_tokens=None):
+    return hashlib.sha256(json.dumps([model, max_tokens, prompt]).encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    JSONL file of recorded LLM calls, one {"key", "model", "prompt",
+    "response"} per line. The same prompt may be recorded several times;
+    replay hands the recordings out in order and then repeats the last one.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._played = {}
+        self.hits = 0
+        self.misses = 0
+
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries.setdefault(entry["key"], []).append(entry["response"])
+        elif mode == "replay":
+            raise FileNotFoundError(f"No cassette at {self.path}")
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def __len__(self):
+        return sum(len(responses) for responses in self._entries.values())
+
+    def play(self, key):
+        with self._lock:
+            responses = self._entries.get(key)
+            if not responses:
+                self.misses += 1
+                return None
+            i = self._played.get(key, 0)
+            self._played[key] = i + 1
+            self.hits += 1
+            return dict(responses[min(i, len(responses) - 1)])
+
+    def record(self, key, prompt, model, response):
+        entry = {"key": key, "model": model, "prompt": prompt, "response": response}
+        with self._lock:
+            self._entries.setdefault(key, []).append(response)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def stats(self):
+        return {"mode": self.mode, "path": str(self.path), "recorded": len(self),
+                "hits": self.hits, "misses": self.misses}
+
+
+class CassetteClient:
+    """
+    Drop-in for LLMClient. In record mode calls go to client and are written
+    to the cassette; in replay mode they are answered from the cassette and
+    no model server is needed. With replay_latency the recorded latency is
+    slept (bounded by the call's timeout, raising LLMTimeout like a slow
+    server would). scheduler queues replayed calls like LLMClient does, so
+    load tests still see admission control.
+    """
+
+    def __init__(self, cassette, client=None, scheduler=None, replay_latency=False):
+        if cassette.mode == "record" and client is None:
+            raise ValueError("Recording needs a real LLMClient")
+        self.cassette = cassette
+        self.client = client
+        self.scheduler = scheduler
+        self.replay_latency = replay_latency
+
+    def chat(self, prompt, model=None, timeout=None, max_tokens=None, on_token=None):
+        key = prompt_key(prompt, model, max_tokens)
+        if self.cassette.mode == "record":
+            response = self.client.chat(prompt, model=model, timeout=timeout, max_tokens=max_tokens,
+                                        on_token=on_token)
+            self.cassette.record(key, prompt, model, response)
+            return response
+
+        if self.scheduler is None:
+            return self._replay(key, timeout, on_token)
+        expires = time.monotonic() + timeout if timeout is not None else None
+        with self.scheduler.slot(timeout=timeout):
+            if expires is not None:
+                timeout = expires - time.monotonic()
+            return self._replay(key, timeout, on_token)
+
+    def _replay(self, key, timeout, on_token):
+        response = self.cassette.play(key)
+        if response is None:
+            raise LLMError(f"No recorded response for prompt {key[:12]} in {self.cassette.path}")
+
+        if self.replay_latency:
+            latency = response.get("latency", 0.0)
+            if timeout is not None and latency > timeout:
+                time.sleep(max(timeout, 0.0))
+                raise LLMTimeout("LLM time budget exhausted (replayed latency)")
+            time.sleep(latency)
+        if on_token is not None:
+            pieces = response["content"].split(" ")
+            for i, piece in enumerate(pieces):
+                on_token(piece if i == len(pieces) - 1 else piece + " ")
+        response["backend"] = "cassette"
+        record_llm_call(response)
+        return response
+
+    # the rest of the LLMClient interface used by the API
+
+    def start_health_checks(self):
+        if self.client is not None:
+            self.client.start_health_checks()
+
+    def status(self):
+        status = self.client.status() if self.client is not None else []
+        return status + [{"name": "cassette", "kind": "cassette", "healthy": True, **self.cassette.stats()}]
+
+
+class VectorFixture:
+    """
+    Recorded embeddings, used in place of rag.retriever's EmbeddingCache
+    (same encode / stats interface). Record mode embeds with the real model
+    and stores every vector in a SQLite file; replay mode only reads that
+    file, so the sentence transformer is never loaded, and an unrecorded
+    text raises KeyError.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode == "replay" and not Path(path).exists():
+            raise FileNotFoundError(f"No vector fixture at {path}")
+        self.mode = mode
+        self.path = path
+        self.store = SQLiteTier(path)
+        self.hits = 0
+        self.misses = 0
+
+    def encode(self, texts, fingerprint, encode_fn):
+        normalized = [normalize_text(t) for t in texts]
+        vectors = []
+        for text in normalized:
+            raw = self.store.get(cache_key(fingerprint, text))
+            if raw is not None:
+                self.hits += 1
+                vectors.append(np.frombuffer(raw, dtype="float32"))
+                continue
+
+            self.misses += 1
+            if self.mode == "replay":
+                raise KeyError(f"No recorded embedding for {text!r} ({fingerprint})")
+            vector = np.asarray(encode_fn([text]), dtype="float32").reshape(-1)
+            self.store.set(cache_key(fingerprint, text), vector.tobytes())
+            vectors.append(vector)
+        return np.vstack(vectors)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "fixture": str(self.path),
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def cassette_mode():
+    return os.environ.get("TRIAGE_CASSETTE_MODE", "replay")
+
+
+def client_from_env(make_client, scheduler=None):
+    """
+    make_client() builds the real LLMClient. With TRIAGE_LLM_CASSETTE set it
+    is wrapped (record) or replaced (replay) by a CassetteClient.
+    """
+    path = os.environ.get("TRIAGE_LLM_CASSETTE")
+    if not path:
+        return make_client()
+
+    mode = cassette_mode()
+    return CassetteClient(
+        Cassette(path, mode),
+        client=make_client() if mode == "record" else None,
+        scheduler=scheduler,
+        replay_latency=os.environ.get("TRIAGE_CASSETTE_LATENCY") == "1"
+    )
+
+
+def fixture_from_env():
+    """The VectorFixture of TRIAGE_EMBED_FIXTURE, or None."""
+    path = os.environ.get("TRIAGE_EMBED_FIXTURE")
+    return VectorFixture(path, cassette_mode()) if path else None
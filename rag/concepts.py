@@ -0,0 +1,96 @@
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+
+# Emergency concepts and red flag keywords live in a versioned data file so
+# they can grow without touching code. The indexing step embeds the concepts
+# once and stores a normalized matrix next to the FAISS index.
+CONCEPTS_PATH = Path(__file__).parent / "concepts.json"
+VECTOR_STORE_DIR = Path(__file__).parent.parent / "embeddings" / "vector_store"
+
+MATRIX_NAME = "emergency_concepts.npy"
+META_NAME = "emergency_concepts.meta.json"
+
+
+def load_concepts(path=CONCEPTS_PATH):
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def concept_fingerprint(concepts, model_name):
+    # changes whenever the concept phrases or the encoder change
+    payload = json.dumps(
+        {"model": model_name, "emergency_concepts": concepts["emergency_concepts"]},
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def flatten_concepts(concepts):
+    """Return parallel lists of (level, text) for every emergency concept."""
+    levels = []
+    texts = []
+    for level, phrases in concepts["emergency_concepts"].items():
+        for text in phrases:
+            levels.append(level)
+            texts.append(text)
+    return levels, texts
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype="float32")
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def build_concept_matrix(concepts, model_name, encode_fn, out_dir=VECTOR_STORE_DIR):
+    """
+    Embed every concept in one batch and save the normalized matrix plus a
+    metadata file holding the fingerprint and the level of each row.
+    encode_fn takes a list of strings and returns a 2D array.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    levels, texts = flatten_concepts(concepts)
+    matrix = normalize_rows(encode_fn(texts))
+    np.save(out_dir / MATRIX_NAME, matrix)
+
+    meta = {
+        "version": concepts.get("version"),
+        "model": model_name,
+        "fingerprint": concept_fingerprint(concepts, model_name),
+        "levels": levels,
+        "texts": texts,
+    }
+    with open(out_dir / META_NAME, "w") as f:
+        json.dump(meta, f)
+
+    return matrix, levels
+
+
+def load_concept_matrix(model_name, encode_fn=None, concepts=None, out_dir=VECTOR_STORE_DIR):
+    """
+    Memory-map the precomputed concept matrix. If it is missing or was built
+    from other concepts / another model, rebuild it with encode_fn.
+    """
+    out_dir = Path(out_dir)
+    concepts = concepts or load_concepts()
+    fingerprint = concept_fingerprint(concepts, model_name)
+
+    meta_path = out_dir / META_NAME
+    matrix_path = out_dir / MATRIX_NAME
+    if meta_path.exists() and matrix_path.exists():
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        if meta.get("fingerprint") == fingerprint:
+            return np.load(matrix_path, mmap_mode="r"), meta["levels"]
+
+    if encode_fn is None:
+        raise FileNotFoundError(
+            f"No up to date concept matrix in {out_dir} and no encoder to build one"
+        )
+    return build_concept_matrix(concepts, model_name, encode_fn, out_dir)
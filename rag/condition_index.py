@@ -0,0 +1,86 @@
+import numpy as np
+
+from rag.threads import apply_faiss_threads
+
+# sections that carry no clinical information for triage
+EXCLUDED_SECTIONS = ["references", "sources"]
+
+
+class ConditionIndex:
+    """
+    Two-level index over the section chunks in documents.json.
+
+    The first level holds one centroid per condition (mean of its section
+    embeddings). A query is matched against the centroids first and only the
+    sections of the closest conditions are then scored, so far fewer vectors
+    are scanned and results spread over several conditions.
+    """
+
+    def __init__(self, index, documents, excluded_sections=EXCLUDED_SECTIONS):
+        # imported here so the API can import limit_per_condition without faiss
+        import faiss
+
+        self.documents = documents
+        self.excluded_sections = set(excluded_sections)
+
+        # the section index is a flat index so its vectors can be read back
+        vectors = index.reconstruct_n(0, index.ntotal)
+
+        rows_by_condition = {}
+        for row, doc in enumerate(documents):
+            meta = doc["metadata"]
+            if meta["section"] in self.excluded_sections:
+                continue
+            rows_by_condition.setdefault(meta["condition"], []).append(row)
+
+        self.conditions = list(rows_by_condition)
+        self.condition_rows = [np.array(rows_by_condition[c]) for c in self.conditions]
+        self.vectors = vectors
+
+        centroids = np.vstack([vectors[rows].mean(axis=0) for rows in self.condition_rows])
+        self.condition_index = faiss.IndexFlatL2(vectors.shape[1])
+        self.condition_index.add(centroids.astype("float32"))
+
+    def search_conditions(self, query_vector, top_conditions=3):
+        """Return [(condition, distance)] for the closest condition centroids."""
+        top_conditions = min(top_conditions, len(self.conditions))
+        apply_faiss_threads()
+        distances, ids = self.condition_index.search(query_vector, top_conditions)
+        return [(self.conditions[i], float(d)) for i, d in zip(ids[0], distances[0]) if i >= 0]
+
+    def search(self, query_vector, k=5, top_conditions=3, max_per_condition=2):
+        """
+        Section level search restricted to the top conditions, keeping at
+        most max_per_condition chunks of each condition.
+        """
+        top_conditions = min(top_conditions, len(self.conditions))
+        apply_faiss_threads()
+        _, ids = self.condition_index.search(query_vector, top_conditions)
+        candidate_ids = [i for i in ids[0] if i >= 0]
+        if not candidate_ids:
+            return []
+
+        rows = np.concatenate([self.condition_rows[i] for i in candidate_ids])
+        query = np.asarray(query_vector, dtype="float32").reshape(1, -1)
+        distances = ((self.vectors[rows] - query) ** 2).sum(axis=1)
+
+        ranked = (self.documents[row] for row in rows[np.argsort(distances)])
+        return limit_per_condition(ranked, k, max_per_condition)
+
+
+def limit_per_condition(ranked_docs, k, max_per_condition=2, excluded_sections=()):
+    """Take the first k documents, at most max_per_condition of each condition."""
+    result = []
+    per_condition = {}
+    for doc in ranked_docs:
+        meta = doc["metadata"]
+        if meta["section"] in excluded_sections:
+            continue
+        if per_condition.get(meta["condition"], 0) >= max_per_condition:
+            continue
+        per_condition[meta["condition"]] = per_condition.get(meta["condition"], 0) + 1
+        result.append(doc)
+        if len(result) == k:
+            break
+
+    return result
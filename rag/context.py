@@ -0,0 +1,116 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Hugging Face tokenizer matching the Ollama model, used to count prompt tokens
+TOKENIZER_NAME = "Qwen/Qwen2.5-7B-Instruct"
+DEFAULT_TOKEN_BUDGET = 600
+
+URGENCY_RANK = {"high": 0, "medium": 1, "low": 2}
+
+_tokenizers = {}
+
+
+class _ApproxTokenizer:
+    """Fallback when the real tokenizer can't be loaded (e.g. offline): ~4 chars per token."""
+
+    name = "approximate (~4 chars per token)"
+
+    def encode(self, text, add_special_tokens=False):
+        return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def get_tokenizer(name=TOKENIZER_NAME):
+    if name not in _tokenizers:
+        try:
+            from transformers import AutoTokenizer
+            _tokenizers[name] = AutoTokenizer.from_pretrained(name)
+        except (ImportError, OSError) as e:
+            logger.warning("Tokenizer %s unavailable, counting ~4 chars per token: %s", name, e)
+            _tokenizers[name] = _ApproxTokenizer()
+    return _tokenizers[name]
+
+
+def tokenizer_name(tokenizer):
+    """What counts the prompt tokens, for the startup report"""
+    return getattr(tokenizer, "name", None) or getattr(tokenizer, "name_or_path", type(tokenizer).__name__)
+
+
+def count_tokens(text, tokenizer=None):
+    tokenizer = tokenizer or get_tokenizer()
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def compact_text(text):
+    """
+    Dict sections are stored as indented JSON by the loader; turn them into
+    "key: a, b; key2: c" and collapse whitespace everywhere else.
+    """
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            value = json.loads(stripped)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict):
+            parts = []
+            for key, item in value.items():
+                if isinstance(item, list):
+                    item = ", ".join(str(i) for i in item)
+                elif isinstance(item, dict):
+                    item = json.dumps(item, separators=(",", ":"))
+                parts.append(f"{key.replace('_', ' ')}: {item}")
+            return "; ".join(parts)
+    return re.sub(r"\s+", " ", stripped)
+
+
+def format_chunk(doc):
+    meta = doc["metadata"]
+    return f"[{meta['condition']} | {meta['section']} | {meta['urgency']}] {compact_text(doc['text'])}"
+
+
+def rank_chunks(retrieved_docs, scores=None):
+    """
+    Order chunks by urgency first, then by score (higher is better). Without
+    scores the retrieval order is used.
+    """
+    if scores is None:
+        scores = [-i for i in range(len(retrieved_docs))]
+    order = sorted(
+        range(len(retrieved_docs)),
+        key=lambda i: (URGENCY_RANK.get(retrieved_docs[i]["metadata"]["urgency"], 3), -scores[i])
+    )
+    return [retrieved_docs[i] for i in order]
+
+
+def build_context(retrieved_docs, token_budget=DEFAULT_TOKEN_BUDGET, scores=None, tokenizer=None):
+    """
+    Build the medical context for the final prompt within token_budget.
+    Returns (context, tokens_used). The chunk that crosses the budget is
+    truncated, anything after it is dropped.
+    """
+    tokenizer = tokenizer or get_tokenizer()
+    lines = []
+    used = 0
+
+    for doc in rank_chunks(retrieved_docs, scores):
+        line = format_chunk(doc)
+        tokens = tokenizer.encode(line + "\n", add_special_tokens=False)
+        remaining = token_budget - used
+        if remaining <= 0:
+            break
+        if len(tokens) > remaining:
+            # not worth keeping a chunk cut down to a few tokens
+            if remaining >= 16:
+                lines.append(tokenizer.decode(tokens[:remaining]).strip())
+                used += remaining
+            break
+        lines.append(line)
+        used += len(tokens)
+
+    return "\n".join(lines), used
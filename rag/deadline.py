@@ -0,0 +1,31 @@
+import time
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before a stage could finish."""
+
+
+class Deadline:
+    """
+    End-to-end time budget of one request. Each stage gets the smaller of
+    its own budget and what is left of the request.
+    """
+
+    def __init__(self, seconds, stage_budgets=None):
+        self.seconds = seconds
+        self.stage_budgets = stage_budgets or {}
+        self.expires = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def budget(self, stage, minimum=0.5):
+        """Seconds available to stage; raises DeadlineExceeded if less than minimum."""
+        remaining = self.remaining()
+        budget = min(remaining, self.stage_budgets.get(stage, remaining))
+        if budget < minimum:
+            raise DeadlineExceeded(f"No time left for stage '{stage}'")
+        return budget
@@ -0,0 +1,175 @@
+"""
+Near-duplicate chunk removal at indexing time: repeated boilerplate and
+near-identical sections (e.g. the "references" of many conditions) take
+index space and crowd out other chunks in the results.
+
+    # build the index without near-duplicates, report in dedup_report.json
+    python rag/embedder.py --dedup 0.95
+    # compare every section across conditions, not only references / sources
+    python rag/embedder.py --dedup 0.95 --dedup-scope section
+    # dry run: what an existing store would lose at a threshold
+    python rag/dedup.py --store embeddings/vector_store --threshold 0.95
+"""
+import argparse
+import json
+import sys
+from collections import Counter
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+from rag.condition_index import EXCLUDED_SECTIONS
+from rag.retriever import doc_id
+
+REPORT_NAME = "dedup_report.json"
+
+# never dropped: a condition must not lose its red flags to a look-alike
+EXEMPT_SECTIONS = ("red_flags",)
+EXEMPT_URGENCY = ("high",)
+
+# non-clinical sections (citations, source lists) repeat across conditions
+# word for word, so they are compared across conditions in either scope
+CROSS_CONDITION_SECTIONS = tuple(EXCLUDED_SECTIONS)
+
+
+class NearDuplicateFilter:
+    """
+    Incremental self-join over the embeddings of an index build. Every batch
+    is searched against the chunks kept so far (an HNSW graph over the
+    normalized vectors, so inner product = cosine similarity) and against
+    itself; a chunk at least threshold similar to an earlier kept chunk is
+    dropped and recorded with the chunk it duplicates.
+
+    Chunks are only compared within their scope: "condition" (default)
+    collapses repeats inside one condition, plus the cross_sections
+    (references, sources) across conditions; "section" compares every
+    section across conditions by name, which removes a shared section from
+    the later conditions. Chunks of EXEMPT_SECTIONS or of high urgency are
+    always kept.
+    """
+
+    def __init__(self, threshold=0.95, scope="condition", hnsw_m=32, ef_search=64,
+                 exempt_sections=EXEMPT_SECTIONS, exempt_urgency=EXEMPT_URGENCY,
+                 cross_sections=CROSS_CONDITION_SECTIONS):
+        if scope not in ("condition", "section"):
+            raise ValueError(f"Unknown dedup scope: {scope}")
+        self.threshold = threshold
+        self.scope = scope
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.exempt_sections = set(exempt_sections)
+        self.exempt_urgency = set(exempt_urgency)
+        self.cross_sections = set(cross_sections)
+        self.indexes = {}    # scope key -> (HNSW index, doc_id per row)
+        self.kept = 0
+        self.removed = []    # {"id", "condition", "section", "duplicate_of", "similarity", "text"}
+
+    def _scope_key(self, doc):
+        meta = doc["metadata"]
+        if self.scope == "section" or meta["section"] in self.cross_sections:
+            return f"section:{meta['section']}"
+        return f"condition:{meta['condition']}"
+
+    def _exempt(self, doc):
+        meta = doc["metadata"]
+        return meta["section"] in self.exempt_sections or meta.get("urgency") in self.exempt_urgency
+
+    def _index(self, key, dimension):
+        if key not in self.indexes:
+            index = faiss.IndexHNSWFlat(dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efSearch = self.ef_search
+            self.indexes[key] = (index, [])
+        return self.indexes[key]
+
+    def filter(self, docs, embeddings):
+        """Boolean mask of the docs to keep; the kept ones join the join index."""
+        vectors = np.array(embeddings, dtype="float32")
+        faiss.normalize_L2(vectors)
+
+        ids = [doc_id(doc) for doc in docs]
+        keys = [self._scope_key(doc) for doc in docs]
+        exempt = np.array([self._exempt(doc) for doc in docs], dtype=bool)
+        keep = np.ones(len(docs), dtype=bool)
+        duplicate_of = [None] * len(docs)
+
+        # against the chunks kept in earlier batches, per scope
+        for key in set(keys):
+            rows = np.array([i for i, k in enumerate(keys) if k == key and not exempt[i]])
+            if key not in self.indexes or not rows.size:
+                continue
+            index, kept_ids = self.indexes[key]
+            similarities, matches = index.search(vectors[rows], 1)
+            for row, similarity, match in zip(rows, similarities[:, 0], matches[:, 0]):
+                if match >= 0 and similarity >= self.threshold:
+                    keep[row] = False
+                    duplicate_of[row] = (kept_ids[match], similarity)
+
+        # duplicates inside the batch: the first occurrence wins
+        batch_similarities = vectors @ vectors.T
+        same_scope = np.array(keys)[:, None] == np.array(keys)[None, :]
+        for i in range(len(docs)):
+            if not keep[i] or exempt[i]:
+                continue
+            earlier = np.flatnonzero(keep[:i] & same_scope[i, :i] & (batch_similarities[i, :i] >= self.threshold))
+            if earlier.size:
+                keep[i] = False
+                duplicate_of[i] = (ids[earlier[0]], batch_similarities[i, earlier[0]])
+
+        for i in np.flatnonzero(~keep):
+            original, similarity = duplicate_of[i]
+            meta = docs[i]["metadata"]
+            self.removed.append({"id": ids[i], "condition": meta["condition"], "section": meta["section"],
+                                 "duplicate_of": original, "similarity": round(float(similarity), 4),
+                                 "text": docs[i]["text"][:200]})
+
+        for i in np.flatnonzero(keep):
+            index, kept_ids = self._index(keys[i], vectors.shape[1])
+            index.add(vectors[i:i + 1])
+            kept_ids.append(ids[i])
+        self.kept += int(keep.sum())
+        return keep
+
+    def report(self):
+        return {
+            "threshold": self.threshold,
+            "scope": self.scope,
+            "cross_condition_sections": sorted(self.cross_sections),
+            "kept": self.kept,
+            "removed": len(self.removed),
+            "removed_by_section": dict(Counter(r["section"] for r in self.removed).most_common()),
+            "chunks": self.removed,
+        }
+
+    def write_report(self, path):
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    from rag.retriever import loader
+
+    parser = argparse.ArgumentParser(description="Report the near-duplicate chunks of a vector store")
+    parser.add_argument("--store", default=str(ROOT / "embeddings" / "vector_store"))
+    parser.add_argument("--threshold", type=float, default=0.95, help="cosine similarity")
+    parser.add_argument("--scope", choices=["condition", "section"], default="condition")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--out", help="report file (default: print a summary)")
+    args = parser.parse_args()
+
+    store = Path(args.store)
+    index, documents = loader(str(store / "faiss.index"), str(store / "documents.json"))
+    vectors = index.reconstruct_n(0, index.ntotal)
+
+    dedup = NearDuplicateFilter(args.threshold, args.scope)
+    for start in range(0, len(documents), args.batch_size):
+        end = start + args.batch_size
+        dedup.filter(documents[start:end], vectors[start:end])
+
+    if args.out:
+        dedup.write_report(args.out)
+    report = dedup.report()
+    print(json.dumps({k: v for k, v in report.items() if k != "chunks"}, indent=2))
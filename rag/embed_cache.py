@@ -0,0 +1,157 @@
+import hashlib
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from rag.accounting import record_cache
+
+
+def normalize_text(text):
+    """Texts that differ only in case, spacing or trailing punctuation share an embedding."""
+    return re.sub(r"\s+", " ", text.strip().lower()).rstrip(".!?")
+
+
+def cache_key(fingerprint, text):
+    return f"{fingerprint}:{hashlib.sha1(text.encode('utf-8')).hexdigest()}"
+
+
+class SQLiteTier:
+    """On-disk tier, shared by every worker process on the node."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        self._db.commit()
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO embeddings VALUES (?, ?)", (key, value))
+            self._db.commit()
+
+
+class RedisTier:
+    """Shared tier on any Redis-compatible server (needs the redis package)."""
+
+    def __init__(self, url, ttl=7 * 24 * 3600):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        return self._client.get(key)
+
+    def set(self, key, value):
+        self._client.set(key, value, ex=self.ttl)
+
+
+class EmbeddingCache:
+    """
+    LRU of embeddings keyed by model fingerprint and normalized text, with an
+    optional shared second tier (SQLiteTier or RedisTier). Vectors are
+    stored as float32 1D arrays.
+
+    The fingerprint is the model name, which stays the same when the weights
+    behind it change (a new revision, a fine-tuned copy at the same path).
+    version is added to every key; change it with the model and the shared
+    tier's old vectors are no longer used.
+    """
+
+    def __init__(self, max_items=10000, shared=None, version=None):
+        self.max_items = max_items
+        self.shared = shared
+        self.version = version
+
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def _get_local(self, key):
+        with self._lock:
+            vector = self._items.get(key)
+            if vector is not None:
+                self._items.move_to_end(key)
+            return vector
+
+    def _put_local(self, key, vector):
+        with self._lock:
+            self._items[key] = vector
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, key):
+        vector = self._get_local(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        if self.shared is not None:
+            try:
+                raw = self.shared.get(key)
+            except Exception:
+                raw = None
+            if raw is not None:
+                vector = np.frombuffer(raw, dtype="float32")
+                self._put_local(key, vector)
+                self.shared_hits += 1
+                return vector
+
+        self.misses += 1
+        return None
+
+    def put(self, key, vector):
+        vector = np.asarray(vector, dtype="float32").reshape(-1)
+        self._put_local(key, vector)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, vector.tobytes())
+            except Exception:
+                # the shared tier is an optimization, never fail a request on it
+                pass
+
+    def encode(self, texts, fingerprint, encode_fn):
+        """
+        Embeddings of texts as a 2D array. Only the misses are passed to
+        encode_fn, in one batch.
+        """
+        normalized = [normalize_text(t) for t in texts]
+        if self.version:
+            fingerprint = f"{fingerprint}@{self.version}"
+        keys = [cache_key(fingerprint, t) for t in normalized]
+        vectors = [self.get(key) for key in keys]
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        record_cache(len(texts) - len(missing), len(missing))
+        if missing:
+            # duplicates inside the batch are encoded once
+            unique = list(dict.fromkeys(normalized[i] for i in missing))
+            encoded = dict(zip(unique, np.asarray(encode_fn(unique), dtype="float32")))
+            for i in missing:
+                vectors[i] = encoded[normalized[i]]
+                self.put(keys[i], vectors[i])
+
+        return np.vstack(vectors)
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "items": len(self._items),
+            "max_items": self.max_items,
+            "version": self.version,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+        }
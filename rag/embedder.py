@@ -1,54 +1,199 @@
 from sentence_transformers import SentenceTransformer
+import argparse
+import itertools
 import json
 from pathlib import Path
 import faiss
-
-#model = SentenceTransformer("all-MiniLM-L6-v2")
-
-def load_processed_docs(forlde_path):
-
-    docs = []
-
-    for file in Path(forlde_path).glob("*.json"):
-        with open(file, "r") as f:
-            docs.extend(json.load(f))
-
-    return docs
-
-documents = load_processed_docs("../data/processed")
-
-def creat_embedding(documents):
-
-    model = SentenceTransformer("all-MiniLM-L6-v2")
-    texts = [doc["text"] for doc in documents]
-    embedding = model.encode(
-        texts,
-        # has to be numpy array to be saved in FAISS
-        convert_to_numpy=True
-        )
-    return embedding
-
-def save_to_faiss(embeddings, documents):
-
-    # create an empty vector space
-    dimension = embeddings.shape[1]
-    # Distance metric = L2 (Euclidean)
-    index = faiss.IndexFlatL2(dimension)
-
-    # add vectors
-    index.add(embeddings)
-
-    # store 
-    faiss.write_index(index, "../embeddings/vector_store/faiss.index")
-
-    with open("../embeddings/vector_store/documents.json", "w") as f:
-        json.dump(documents, f, indent=2)
-
-docs = load_processed_docs("../data/processed")
-embeddings = creat_embedding(docs)
-save_to_faiss(embeddings, docs)
-
-
-
-
-
+import sys
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+from rag.concepts import load_concepts, build_concept_matrix
+
+PROCESSED_DIR = ROOT / "data" / "processed"
+VECTOR_STORE_DIR = ROOT / "embeddings" / "vector_store"
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def iter_processed_docs(forlde_path, worker_index=0, num_workers=1):
+    """
+    Yield processed documents one at a time from the JSONL shards written by
+    rag/loader.py. With num_workers > 1 each worker only reads the shards
+    i where i % num_workers == worker_index, so workers split the corpus
+    without coordination.
+    """
+    shards = sorted(Path(forlde_path).glob("*.jsonl"))
+    for i, shard in enumerate(shards):
+        if i % num_workers != worker_index:
+            continue
+        with open(shard, "r") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def build_index(documents, index_path, documents_path, model_name=MODEL_NAME, batch_size=256, dedup=None,
+                allow_empty=False):
+    """
+    Embed and index documents batch by batch. documents can be any iterable
+    (e.g. iter_processed_docs), only one batch is held in memory; the
+    documents file is written as a JSON array, one document per line.
+    dedup (a rag.dedup.NearDuplicateFilter) drops near-duplicate chunks.
+    allow_empty writes an empty index instead of raising when there are no
+    documents (a worker that got no shards).
+    """
+    model = SentenceTransformer(model_name)
+    index = None
+    count = 0
+
+    # written next to the targets and moved over them at the end, so a
+    # running API never sees a half written store or a mismatched pair
+    documents_path, index_path = Path(documents_path), Path(index_path)
+    documents_tmp = documents_path.with_name(documents_path.name + ".tmp")
+    index_tmp = index_path.with_name(index_path.name + ".tmp")
+    documents_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(documents_tmp, "w") as f:
+        f.write("[\n")
+        for batch in batched(documents, batch_size):
+            # has to be numpy array to be saved in FAISS
+            embeddings = model.encode([doc["text"] for doc in batch], convert_to_numpy=True)
+            if dedup is not None:
+                keep = dedup.filter(batch, embeddings)
+                batch = [doc for doc, kept in zip(batch, keep) if kept]
+                embeddings = embeddings[keep]
+            if index is None:
+                # Distance metric = L2 (Euclidean)
+                index = faiss.IndexFlatL2(embeddings.shape[1])
+            index.add(embeddings)
+
+            for doc in batch:
+                f.write(",\n" if count else "")
+                f.write(json.dumps(doc, ensure_ascii=False))
+                count += 1
+        f.write("\n]\n")
+
+    if index is None:
+        if not allow_empty:
+            documents_tmp.unlink()
+            raise ValueError("No documents to index")
+        index = faiss.IndexFlatL2(model.get_sentence_embedding_dimension())
+    faiss.write_index(index, str(index_tmp))
+    index_tmp.replace(index_path)
+    documents_tmp.replace(documents_path)
+    return count
+
+
+def merge_worker_outputs(out_dir, num_workers):
+    """
+    Combine the faiss-<i>.index / documents-<i>.json of num_workers embedding
+    workers into the faiss.index / documents.json the API loads, then remove
+    the per-worker files. Rows keep the worker order, so the merged
+    documents line up with the merged index. Empty worker outputs (more
+    workers than shards) are skipped.
+    """
+    out_dir = Path(out_dir)
+    parts = [(out_dir / f"faiss-{i}.index", out_dir / f"documents-{i}.json") for i in range(num_workers)]
+    missing = [str(path) for part in parts for path in part if not path.exists()]
+    if missing:
+        raise FileNotFoundError(f"Missing worker output: {', '.join(missing)}")
+
+    index = None
+    count = 0
+    with open(out_dir / "documents.json.tmp", "w") as f:
+        f.write("[\n")
+        for index_path, documents_path in parts:
+            part = faiss.read_index(str(index_path))
+            with open(documents_path, "r") as docs_file:
+                documents = json.load(docs_file)
+            if len(documents) != part.ntotal:
+                raise ValueError(f"{documents_path} has {len(documents)} documents for {part.ntotal} vectors")
+            if not documents:
+                continue
+            if index is None:
+                index = faiss.IndexFlatL2(part.d)
+            index.add(part.reconstruct_n(0, part.ntotal))
+            for doc in documents:
+                f.write(",\n" if count else "")
+                f.write(json.dumps(doc, ensure_ascii=False))
+                count += 1
+        f.write("\n]\n")
+
+    if index is None:
+        (out_dir / "documents.json.tmp").unlink()
+        raise ValueError("No documents to index")
+    faiss.write_index(index, str(out_dir / "faiss.index.tmp"))
+    (out_dir / "faiss.index.tmp").replace(out_dir / "faiss.index")
+    (out_dir / "documents.json.tmp").replace(out_dir / "documents.json")
+    for index_path, documents_path in parts:
+        index_path.unlink()
+        documents_path.unlink()
+    return count
+
+
+def save_concept_matrix(model_name=MODEL_NAME, out_dir=VECTOR_STORE_DIR):
+    # embed the emergency concepts once so the API does not have to on every start
+    model = SentenceTransformer(model_name)
+    build_concept_matrix(
+        load_concepts(),
+        model_name,
+        lambda texts: model.encode(texts, convert_to_numpy=True),
+        out_dir
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Embed the processed corpus into a FAISS index")
+    parser.add_argument("--processed", default=str(PROCESSED_DIR), help="directory of JSONL shards")
+    parser.add_argument("--out", default=str(VECTOR_STORE_DIR), help="vector store directory")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--worker-index", type=int, default=0)
+    parser.add_argument("--num-workers", type=int, default=1)
+    parser.add_argument("--merge", action="store_true",
+                        help="after all workers finished: merge their output into faiss.index / documents.json")
+    parser.add_argument("--dedup", type=float, metavar="SIMILARITY",
+                        help="drop chunks at least this cosine similar to an earlier one, e.g. 0.95")
+    parser.add_argument("--dedup-scope", choices=["condition", "section"], default="condition",
+                        help="compare chunks of the same condition (references / sources across conditions), "
+                             "or of the same section across conditions")
+    args = parser.parse_args()
+
+    out = Path(args.out)
+    if args.merge:
+        count = merge_worker_outputs(out, args.num_workers)
+        print(f"Merged {count} documents from {args.num_workers} workers into {out}")
+        sys.exit(0)
+
+    dedup = None
+    if args.dedup:
+        from rag.dedup import NearDuplicateFilter, REPORT_NAME
+        dedup = NearDuplicateFilter(args.dedup, args.dedup_scope)
+
+    suffix = f"-{args.worker_index}" if args.num_workers > 1 else ""
+    count = build_index(
+        iter_processed_docs(args.processed, args.worker_index, args.num_workers),
+        out / f"faiss{suffix}.index",
+        out / f"documents{suffix}.json",
+        args.model,
+        args.batch_size,
+        dedup,
+        # with more workers than shards some get nothing, the merge skips them
+        allow_empty=args.num_workers > 1
+    )
+    print(f"Indexed {count} documents into {out}")
+    if dedup is not None:
+        dedup.write_report(out / f"{Path(REPORT_NAME).stem}{suffix}.json")
+        print(f"Dropped {len(dedup.removed)} near-duplicate chunks")
+    if args.worker_index == 0:
+        # the same for every worker, so only written once
+        save_concept_matrix(args.model, out)
@@ -0,0 +1,46 @@
+# Deterministic triage used when the LLM can't answer within the deadline.
+# It only looks at the metadata of the retrieved chunks and always leans
+# towards the safer level.
+from rag.context import compact_text
+
+LEVELS = ["stay_home", "see_gp", "urgent_gp", "call_911"]
+
+URGENCY_LEVEL = {
+    "high": "urgent_gp",
+    "medium": "see_gp",
+    "low": "see_gp",
+}
+
+
+def safer_level(a, b):
+    return max(a, b, key=LEVELS.index)
+
+
+def degraded_triage(retrieved_docs, minimum_level="see_gp"):
+    """Build a triage result from the highest urgency retrieved chunks."""
+    level = minimum_level
+    conditions = []
+    watch_for = []
+
+    for doc in retrieved_docs:
+        meta = doc["metadata"]
+        level = safer_level(level, URGENCY_LEVEL.get(meta["urgency"], minimum_level))
+        if meta["condition"] not in conditions:
+            conditions.append(meta["condition"])
+        if meta["section"] == "red_flags" and len(watch_for) < 3:
+            watch_for.append(compact_text(doc["text"])[:200])
+
+    what_to_do = ["Contact a GP or NHS 111 for advice"]
+    if level == "urgent_gp":
+        what_to_do = ["Get an urgent GP appointment or call NHS 111 today"]
+    if conditions:
+        what_to_do.append(f"Mention possible related conditions: {', '.join(conditions[:3])}")
+
+    return {
+        "type": "triage",
+        "level": level,
+        "confidence": "low",
+        "what_to_do": what_to_do,
+        "watch_for": watch_for or ["Symptoms getting worse or new severe symptoms"],
+        "degraded": True
+    }
@@ -0,0 +1,338 @@
+import json
+import os
+import threading
+import time
+
+import httpx
+
+from rag.accounting import record_llm_call
+
+DEFAULT_MODEL = "qwen2.5:7b-instruct"
+DEFAULT_OLLAMA_URL = "http://localhost:11434"
+
+
+class LLMError(Exception):
+    """Raised when no backend could answer a chat request."""
+
+
+class LLMTimeout(LLMError):
+    """Raised when the request's time budget ran out before any backend answered."""
+
+
+class Backend:
+    """
+    One model server. Keeps a pooled HTTP client plus the bookkeeping the
+    load balancer needs (outstanding requests, health).
+    """
+
+    kind = None
+
+    def __init__(self, url, model=None, timeout=120.0, name=None, max_connections=8):
+        self.url = url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.name = name or f"{self.kind}:{self.url}"
+
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.last_error = None
+
+        self.http = httpx.Client(
+            base_url=self.url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def chat(self, messages, model, timeout=None, max_tokens=None, on_token=None):
+        """
+        Return (content, prompt_tokens, completion_tokens). With on_token the
+        reply is streamed and on_token(text) is called for every piece.
+        """
+        raise NotImplementedError
+
+    def ping(self):
+        raise NotImplementedError
+
+    def status(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "failures": self.failures,
+            "last_error": self.last_error,
+        }
+
+
+class OllamaBackend(Backend):
+    kind = "ollama"
+
+    def chat(self, messages, model, timeout=None, max_tokens=None, on_token=None):
+        payload = {"model": model, "messages": messages, "stream": on_token is not None}
+        if max_tokens is not None:
+            payload["options"] = {"num_predict": max_tokens}
+        if on_token is not None:
+            return self._stream(payload, timeout, on_token)
+
+        response = self.http.post("/api/chat", json=payload, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        return (
+            data["message"]["content"],
+            data.get("prompt_eval_count", 0),
+            data.get("eval_count", 0),
+        )
+
+    def _stream(self, payload, timeout, on_token):
+        # newline delimited JSON, the last line carries the token counts
+        parts = []
+        with self.http.stream("POST", "/api/chat", json=payload, timeout=timeout) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                text = data.get("message", {}).get("content", "")
+                if text:
+                    parts.append(text)
+                    on_token(text)
+                if data.get("done"):
+                    return "".join(parts), data.get("prompt_eval_count", 0), data.get("eval_count", 0)
+        return "".join(parts), 0, 0
+
+    def ping(self):
+        self.http.get("/api/tags", timeout=5.0).raise_for_status()
+
+
+class OpenAIBackend(Backend):
+    """OpenAI-compatible server, e.g. a local vLLM or llama.cpp server."""
+
+    kind = "openai"
+
+    def __init__(self, url, model=None, timeout=120.0, name=None, max_connections=8, api_key=None):
+        super().__init__(url, model, timeout, name, max_connections)
+        from openai import OpenAI
+
+        # share the pooled httpx client; failover is handled by LLMClient
+        self.client = OpenAI(
+            base_url=self.url,
+            api_key=api_key or os.environ.get("OPENAI_API_KEY", "not-needed"),
+            http_client=self.http,
+            timeout=timeout,
+            max_retries=0
+        )
+
+    def chat(self, messages, model, timeout=None, max_tokens=None, on_token=None):
+        kwargs = {"model": model, "messages": messages, "timeout": timeout}
+        if max_tokens is not None:
+            kwargs["max_tokens"] = max_tokens
+        if on_token is not None:
+            return self._stream(kwargs, on_token)
+
+        response = self.client.chat.completions.create(**kwargs)
+        usage = response.usage
+        return (
+            response.choices[0].message.content,
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    def _stream(self, kwargs, on_token):
+        parts = []
+        usage = None
+        stream = self.client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+        with stream:
+            for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    parts.append(text)
+                    on_token(text)
+        return (
+            "".join(parts),
+            usage.prompt_tokens if usage else 0,
+            usage.completion_tokens if usage else 0,
+        )
+
+    def ping(self):
+        self.client.models.list(timeout=5.0)
+
+
+BACKENDS = {"ollama": OllamaBackend, "openai": OpenAIBackend}
+
+
+class LLMClient:
+    """
+    Sends chat requests to a list of backends, picking the healthy backend
+    with the fewest outstanding requests and failing over to the next one
+    when a request errors or hits the backend's own timeout. A request cut
+    off by the caller's time budget is not held against the backend.
+    """
+
+    def __init__(self, backends, default_model=DEFAULT_MODEL, health_interval=15.0, scheduler=None):
+        if not backends:
+            raise ValueError("LLMClient needs at least one backend")
+        self.backends = backends
+        self.default_model = default_model
+        self.health_interval = health_interval
+        # optional rag.scheduler.LLMScheduler deciding which call runs next
+        self.scheduler = scheduler
+
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    @classmethod
+    def from_config(cls, config, default_model=DEFAULT_MODEL, **kwargs):
+        """
+        config is a list of dicts such as
+        {"kind": "openai", "url": "http://localhost:8001/v1", "model": "qwen2.5-7b", "timeout": 60}
+        """
+        backends = []
+        for entry in config:
+            entry = dict(entry)
+            backend_cls = BACKENDS[entry.pop("kind", "ollama")]
+            backends.append(backend_cls(**entry))
+        return cls(backends, default_model=default_model, **kwargs)
+
+    @classmethod
+    def from_env(cls, default_model=DEFAULT_MODEL, **kwargs):
+        """Backends come from TRIAGE_LLM_BACKENDS (JSON list), default is the local Ollama."""
+        raw = os.environ.get("TRIAGE_LLM_BACKENDS")
+        config = json.loads(raw) if raw else [{"kind": "ollama", "url": DEFAULT_OLLAMA_URL}]
+        return cls.from_config(config, default_model=default_model, **kwargs)
+
+    def _pick(self, tried):
+        with self._lock:
+            candidates = [b for b in self.backends if b not in tried]
+            if not candidates:
+                return None
+            # prefer healthy backends, but still try unhealthy ones rather than fail
+            healthy = [b for b in candidates if b.healthy] or candidates
+            backend = min(healthy, key=lambda b: b.outstanding)
+            backend.outstanding += 1
+            return backend
+
+    def _release(self, backend, error=None, timed_out=False):
+        with self._lock:
+            backend.outstanding -= 1
+            if timed_out:
+                return  # the caller's budget ran out, that says nothing about the backend
+            if error is None:
+                backend.failures = 0
+                backend.healthy = True
+            else:
+                backend.failures += 1
+                backend.last_error = str(error)
+                backend.healthy = False
+
+    def chat(self, prompt, model=None, timeout=None, max_tokens=None, on_token=None):
+        """
+        Send a single user prompt. Returns a dict with the reply content,
+        the backend and model used, token counts and latency.
+
+        timeout is the total budget across failover attempts. When it runs
+        out the HTTP request is dropped, which makes the server abort the
+        generation, and LLMTimeout is raised. Time spent queued in the
+        scheduler counts against the same budget.
+
+        on_token(text) streams the reply as it is generated. Once a piece has
+        been passed on there is no failover, a failing stream raises LLMError.
+        """
+        if self.scheduler is None:
+            response = self._chat(prompt, model, timeout, max_tokens, on_token)
+        else:
+            expires = time.monotonic() + timeout if timeout is not None else None
+            with self.scheduler.slot(timeout=timeout):
+                if expires is not None:
+                    timeout = expires - time.monotonic()
+                response = self._chat(prompt, model, timeout, max_tokens, on_token)
+
+        # counted against the session the current request belongs to
+        record_llm_call(response)
+        return response
+
+    def _chat(self, prompt, model, timeout, max_tokens, on_token=None):
+        messages = [{"role": "user", "content": prompt}]
+        tried = []
+        errors = []
+        expires = time.monotonic() + timeout if timeout is not None else None
+
+        while True:
+            remaining = None
+            if expires is not None:
+                remaining = expires - time.monotonic()
+                if remaining <= 0:
+                    raise LLMTimeout("LLM time budget exhausted: " + "; ".join(errors))
+
+            backend = self._pick(tried)
+            if backend is None:
+                raise LLMError("All LLM backends failed: " + "; ".join(errors))
+            tried.append(backend)
+            # never wait longer than the backend's own timeout
+            attempt_timeout = backend.timeout if remaining is None else min(remaining, backend.timeout)
+
+            use_model = model or backend.model or self.default_model
+            streamed = []
+            stream_fn = None
+            if on_token is not None:
+                def stream_fn(text):
+                    # the HTTP timeout is per read when streaming, enforce the total here
+                    if expires is not None and time.monotonic() > expires:
+                        raise LLMTimeout("LLM time budget exhausted while streaming")
+                    streamed.append(text)
+                    on_token(text)
+
+            start = time.perf_counter()
+            try:
+                content, prompt_tokens, completion_tokens = backend.chat(
+                    messages, use_model, timeout=attempt_timeout, max_tokens=max_tokens, on_token=stream_fn
+                )
+            except Exception as e:
+                if isinstance(e, LLMTimeout) or (expires is not None and time.monotonic() >= expires):
+                    # cut off by the request's own budget: no failover, the backend stays
+                    # healthy, but the call and the time it took still count
+                    self._release(backend, timed_out=True)
+                    record_llm_call({"backend": backend.name, "prompt_tokens": 0, "completion_tokens": 0,
+                                     "latency": time.perf_counter() - start})
+                    raise LLMTimeout(f"LLM time budget exhausted on {backend.name}: {e}") from e
+                self._release(backend, e)
+                errors.append(f"{backend.name}: {e}")
+                if streamed:
+                    # part of the reply already went out, another backend can't continue it
+                    raise LLMError(f"Stream from {backend.name} failed: {e}")
+                continue
+
+            self._release(backend)
+            return {
+                "content": content,
+                "backend": backend.name,
+                "model": use_model,
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "latency": time.perf_counter() - start,
+            }
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                backend.ping()
+            except Exception as e:
+                backend.healthy = False
+                backend.last_error = str(e)
+            else:
+                backend.healthy = True
+
+    def _health_loop(self):
+        while True:
+            self.check_health()
+            time.sleep(self.health_interval)
+
+    def start_health_checks(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, name="llm-health", daemon=True)
+            self._health_thread.start()
+
+    def status(self):
+        return [b.status() for b in self.backends]
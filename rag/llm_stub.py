@@ -0,0 +1,136 @@
+"""
+Minimal stand-in for a model server, for trying LLMClient without a GPU or
+a 7B model. Speaks both the Ollama (/api/chat, /api/tags) and the
+OpenAI-compatible (/v1/chat/completions, /v1/models) protocols, streamed
+or not.
+
+    python rag/llm_stub.py --port 11500 --delay 0.2 --reply '{"type": "stop", "confidence": 0.9}'
+    TRIAGE_LLM_BACKENDS='[{"kind": "ollama", "url": "http://localhost:11500"}]' uvicorn app.api:app
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def make_handler(reply, delay, fail):
+
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, content_type, lines):
+            # HTTP/1.0 without Content-Length: the body ends when the connection closes
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.end_headers()
+            for line in lines:
+                self.wfile.write(line.encode("utf-8"))
+                self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send(200, {"models": [{"name": "stub"}]})
+            elif self.path == "/v1/models":
+                self._send(200, {"object": "list", "data": [{"id": "stub", "object": "model"}]})
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            time.sleep(delay)
+            if fail:
+                self._send(500, {"error": "stub failure"})
+                return
+
+            prompt_tokens = sum(len(m["content"].split()) for m in request.get("messages", []))
+            completion_tokens = len(reply.split())
+            pieces = [word + " " for word in reply.split(" ")]
+            pieces[-1] = pieces[-1][:-1]
+            if request.get("stream") and self.path == "/api/chat":
+                lines = [json.dumps({"message": {"role": "assistant", "content": p}, "done": False}) + "\n"
+                         for p in pieces]
+                lines.append(json.dumps({
+                    "message": {"role": "assistant", "content": ""},
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": completion_tokens,
+                }) + "\n")
+                self._stream("application/x-ndjson", lines)
+            elif request.get("stream") and self.path == "/v1/chat/completions":
+                def event(delta, usage=None):
+                    chunk = {
+                        "id": "stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model"),
+                        "choices": [{"index": 0, "delta": delta, "finish_reason": None}] if delta else [],
+                        "usage": usage,
+                    }
+                    return f"data: {json.dumps(chunk)}\n\n"
+
+                lines = [event({"content": p}) for p in pieces]
+                lines.append(event(None, {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }))
+                lines.append("data: [DONE]\n\n")
+                self._stream("text/event-stream", lines)
+            elif self.path == "/api/chat":
+                self._send(200, {
+                    "model": request.get("model"),
+                    "message": {"role": "assistant", "content": reply},
+                    "done": True,
+                    "prompt_eval_count": prompt_tokens,
+                    "eval_count": completion_tokens,
+                })
+            elif self.path == "/v1/chat/completions":
+                self._send(200, {
+                    "id": "stub",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": reply},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                })
+            else:
+                self._send(404, {"error": "not found"})
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port, reply, delay=0.0, fail=False, background=False):
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(reply, delay, fail))
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub LLM server")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--reply", default='{"type": "stop", "confidence": 0.9}')
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering")
+    parser.add_argument("--fail", action="store_true", help="answer every chat request with HTTP 500")
+    args = parser.parse_args()
+    serve(args.port, args.reply, args.delay, args.fail)
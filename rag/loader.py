@@ -1,7 +1,46 @@
+import argparse
 import json
-import json
+import logging
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-import os
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+logger = logging.getLogger(__name__)
+
+RAW_DIR = ROOT / "data" / "raw"
+OUTPUT_DIR = ROOT / "data" / "processed"
+SHARD_SIZE = 50000
+
+# tokenizer of the embedding model, chunks must fit its input window
+CHUNK_TOKENIZER = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_CHUNK_TOKENS = 200
+
+# The raw files don't agree on section names; map the variants onto one name
+SECTION_ALIASES = {
+    "cause": "causes",
+    "common_causes": "causes",
+    "cause_risk_factors": "causes_and_risk_factors",
+    "causes_risk_factors": "causes_and_risk_factors",
+    "people_at_risk": "risk_factors",
+    "high_risk_groups": "risk_factors",
+    "possible_complications": "complications",
+    "long_term_complications": "complications",
+    "self_care": "home_treatment",
+    "transmission": "spread",
+}
+
+SECTION_URGENCY = {
+    "symptoms": "medium",
+    "red_flags": "high",
+}
+
+REQUIRED_SECTIONS = ["symptoms", "red_flags"]
+
+
 def load_json(path):
     with open(path, 'r') as file:
         data = json.load(file)
@@ -9,8 +48,87 @@ def load_json(path):
     return data
 
 
+def normalize_section(name):
+    name = re.sub(r"[^a-z0-9]+", "_", name.strip().lower()).strip("_")
+    return SECTION_ALIASES.get(name, name)
+
+
+def validate(json_data):
+    """Return a list of schema errors for one raw condition file."""
+    if not isinstance(json_data, dict):
+        return ["top level value must be an object"]
+
+    errors = []
+    condition = json_data.get("condition")
+    if not isinstance(condition, str) or not condition.strip():
+        errors.append("'condition' must be a non-empty string")
+
+    synonyms = json_data.get("synonyms", [])
+    if not isinstance(synonyms, list) or not all(isinstance(s, str) for s in synonyms):
+        errors.append("'synonyms' must be a list of strings")
+
+    sections = {normalize_section(k) for k in json_data if k not in ["condition", "synonyms"]}
+    for section in REQUIRED_SECTIONS:
+        if section not in sections:
+            errors.append(f"missing section '{section}'")
+
+    for key, value in json_data.items():
+        if key in ["condition", "synonyms"]:
+            continue
+        if not isinstance(value, (str, list, dict)):
+            errors.append(f"section '{key}' must be a string, list or object")
+
+    return errors
+
+
+def format_value(value):
+    """Plain text for a section value; objects become 'key: value; key: value'."""
+    if isinstance(value, list):
+        return ", ".join(format_value(v) for v in value)
+    if isinstance(value, dict):
+        return "; ".join(f"{k.replace('_', ' ')}: {format_value(v)}" for k, v in value.items())
+    return str(value).strip()
+
+
+def split_chunks(text, tokenizer, max_tokens=MAX_CHUNK_TOKENS):
+    """
+    Split text on sentence / list boundaries into chunks of at most max_tokens.
+    A sentence longer than that is split between words, and a single word
+    that is still too long (e.g. a URL) by tokens.
+    """
+    def size(t):
+        return len(tokenizer.encode(t, add_special_tokens=False))
 
-def create_document(json_data):
+    if size(text) <= max_tokens:
+        return [text]
+
+    pieces = []
+    for sentence in re.split(r"(?<=[.;!?,])\s+", text):
+        if size(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        for word in sentence.split():
+            if size(word) <= max_tokens:
+                pieces.append(word)
+                continue
+            tokens = tokenizer.encode(word, add_special_tokens=False)
+            pieces.extend(tokenizer.decode(tokens[i:i + max_tokens]) for i in range(0, len(tokens), max_tokens))
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        candidate = f"{current} {piece}".strip() if current else piece
+        if current and size(candidate) > max_tokens:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def create_document(json_data, tokenizer=None, max_tokens=MAX_CHUNK_TOKENS):
     documents = []
 
 
@@ -20,58 +138,136 @@ def create_document(json_data):
 
         if key not in ["condition", "synonyms"]:
 
-            #dic["text"] = value
-            if key == "symptoms":
-                urgency = "medium"
-            elif key == "red_flags":
-                urgency = "high"
-            else:
-                urgency = "low"
-            metadata = {"condition": condition, "section": key, "urgency": urgency }
-
-            if isinstance(value, list):
-                text = ", ".join(value)
-            elif isinstance(value, dict):
-                text = json.dumps(value, indent=2)
-            else:
-                text = str(value)
-
-            document = {
-                "text": text,
-                "metadata": metadata
-            }
-            documents.append(document)
+            section = normalize_section(key)
+            urgency = SECTION_URGENCY.get(section, "low")
+            text = format_value(value)
+            if not text:
+                continue
+
+            chunks = split_chunks(text, tokenizer, max_tokens) if tokenizer else [text]
+            for i, chunk in enumerate(chunks):
+                metadata = {"condition": condition, "section": section, "urgency": urgency}
+                if len(chunks) > 1:
+                    metadata["chunk"] = i
+
+                document = {
+                    "text": chunk,
+                    "metadata": metadata
+                }
+                documents.append(document)
 
     return documents
 
-def save_documents(documents, output_path):
-    output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with open(output_path, "w") as file:
-        json.dump(documents, file, indent=2)
+def process_file(path, max_tokens=MAX_CHUNK_TOKENS):
+    """Worker: load, validate and chunk one raw file. Returns (documents, errors)."""
+    from rag.context import get_tokenizer
 
+    try:
+        data = load_json(path)
+    except (OSError, json.JSONDecodeError) as e:
+        return [], [str(e)]
 
-if __name__ == "__main__":
+    errors = validate(data)
+    if errors:
+        return [], errors
+    return create_document(data, get_tokenizer(CHUNK_TOKENIZER), max_tokens), []
+
+
+class ShardWriter:
+    """Writes documents as compact JSON lines into documents-00000.jsonl, documents-00001.jsonl, ..."""
+
+    def __init__(self, output_dir, shard_size=SHARD_SIZE):
+        self.output_dir = Path(output_dir)
+        self.shard_size = shard_size
+        self.count = 0
+        self.shards = []
+        self._file = None
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        # stale shards from a bigger previous build would be picked up by the indexer
+        for old in self.output_dir.glob("documents-*.jsonl"):
+            old.unlink()
 
-    file_names = os.listdir("../data/raw")
+    def write(self, document):
+        if self._file is None or self.count % self.shard_size == 0:
+            self.close()
+            path = self.output_dir / f"documents-{len(self.shards):05d}.jsonl"
+            self.shards.append(path)
+            self._file = open(path, "w")
+        self._file.write(json.dumps(document, separators=(",", ":"), ensure_ascii=False))
+        self._file.write("\n")
+        self.count += 1
 
-    for f in file_names:
-        data = load_json(f"../data/raw/{f}")
-        documents = create_document(data)
-        new_name, _ = f.split(".")
-        output_path = Path(f"../data/processed/{new_name}_docs.json")
-        save_documents(documents, output_path)
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
-#data = load_json("../data/raw/sore_throat.json")
-#documents = create_document(data)
-#output_path = Path("../data/processed/sore_throat_docs.json")
-#save_documents(documents, output_path)
 
-#for doc in documents:
-   # print("----")
-    #print("TEXT:")
-    #print(doc["text"])
-    #print("METADATA:")
-    #print(doc["metadata"])
+def save_documents(documents, output_dir, shard_size=SHARD_SIZE):
+    writer = ShardWriter(output_dir, shard_size)
+    for document in documents:
+        writer.write(document)
+    writer.close()
+    return writer.shards
+
+
+def build_corpus(raw_dir, output_dir, workers=None, max_tokens=MAX_CHUNK_TOKENS, strict=False,
+                 shard_size=SHARD_SIZE):
+    """
+    Process every raw condition file in parallel and stream the chunks into
+    JSONL shards. Results are written in sorted file order so the output is
+    reproducible. Returns {file name: [errors]} for the files that failed
+    validation.
+    """
+    paths = sorted(Path(raw_dir).glob("*.json"))
+    failures = {}
+
+    if strict:
+        # validation is cheap, check everything before writing anything
+        for path in paths:
+            try:
+                errors = validate(load_json(path))
+            except (OSError, json.JSONDecodeError) as e:
+                errors = [str(e)]
+            if errors:
+                failures[path.name] = errors
+        if failures:
+            log_failures(failures)
+            return failures
+
+    writer = ShardWriter(output_dir, shard_size)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, (docs, errors) in zip(paths, pool.map(process_file, paths, [max_tokens] * len(paths))):
+            if errors:
+                failures[path.name] = errors
+            for doc in docs:
+                writer.write(doc)
+    writer.close()
+
+    log_failures(failures)
+    logger.info("%d chunks from %d/%d files -> %d shard(s) in %s",
+                writer.count, len(paths) - len(failures), len(paths), len(writer.shards), output_dir)
+    return failures
+
+
+def log_failures(failures):
+    for name, errors in failures.items():
+        for error in errors:
+            logger.warning("%s: %s", name, error)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the processed corpus from raw condition files")
+    parser.add_argument("--raw", default=str(RAW_DIR), help="directory of raw condition JSON files")
+    parser.add_argument("--out", default=str(OUTPUT_DIR), help="output directory for the JSONL shards")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="documents per shard")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-tokens", type=int, default=MAX_CHUNK_TOKENS, help="max tokens per chunk")
+    parser.add_argument("--strict", action="store_true", help="write nothing if any file fails validation")
+    args = parser.parse_args()
 
-    
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    failures = build_corpus(args.raw, args.out, args.workers, args.max_tokens, args.strict, args.shard_size)
+    sys.exit(1 if failures and args.strict else 0)
@@ -0,0 +1,274 @@
+"""
+Append-only log of finished triage sessions (inputs, retrieved chunks,
+triage level, stage timings, models) for offline analysis, a columnar
+export of it and a few aggregate queries.
+
+    # columnar copy of the log: Parquet with pyarrow installed, CSV otherwise
+    python rag/outcomes.py export logs/outcomes.jsonl logs/outcomes.parquet
+    # level distribution, stop reasons and latency percentiles per stage
+    python rag/outcomes.py summary logs/outcomes.jsonl
+    # sessions per value of a column
+    python rag/outcomes.py count logs/outcomes.parquet --by retrieval_query
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+class OutcomeLog:
+    """
+    log() only puts a record on a queue; a writer thread appends the queued
+    records to a JSONL file in batches (batch_size records or every
+    flush_interval seconds), so request handlers never wait on the disk.
+    When the queue is full records are dropped and counted instead.
+
+    With export_path set the writer also rewrites a columnar copy of the
+    whole log every export_interval seconds.
+    """
+
+    def __init__(self, path, batch_size=100, flush_interval=2.0, max_queue=10000,
+                 export_path=None, export_interval=3600):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.export_path = export_path
+        self.export_interval = export_interval
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._last_export = time.monotonic()
+        self.written = 0
+        self.dropped = 0
+        self.last_error = None
+        self.last_export = None
+
+        self._thread = threading.Thread(target=self._run, name="outcome-log", daemon=True)
+        self._thread.start()
+
+    def log(self, record):
+        """Queue a record; returns False when it was dropped."""
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            if batch:
+                try:
+                    self._write(batch)
+                finally:
+                    # flush() must not hang on a batch that failed
+                    for _ in batch:
+                        self._queue.task_done()
+            if self.export_path and time.monotonic() - self._last_export >= self.export_interval:
+                self._export()
+
+    def _write(self, batch):
+        try:
+            with open(self.path, "a") as f:
+                f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch))
+            self.written += len(batch)
+        except Exception as e:
+            # e.g. a record that isn't JSON serializable: drop the batch, keep the writer alive
+            self.last_error = str(e)
+            self.dropped += len(batch)
+            logger.exception("Could not write %d outcome records", len(batch))
+
+    def _export(self):
+        self._last_export = time.monotonic()
+        if not self.path.exists():
+            return
+        try:
+            self.last_export = str(export(self.path, self.export_path))
+        except Exception as e:
+            self.last_error = str(e)
+            logger.exception("Outcome export failed")
+
+    def stats(self):
+        return {
+            "path": str(self.path),
+            "written": self.written,
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "export_path": str(self.export_path) if self.export_path else None,
+            "last_export": self.last_export,
+            "last_error": self.last_error,
+        }
+
+
+def log_from_env():
+    """The OutcomeLog of TRIAGE_OUTCOME_LOG, or None."""
+    path = os.environ.get("TRIAGE_OUTCOME_LOG")
+    if not path:
+        return None
+    return OutcomeLog(
+        path,
+        export_path=os.environ.get("TRIAGE_OUTCOME_EXPORT"),
+        export_interval=float(os.environ.get("TRIAGE_OUTCOME_EXPORT_SECONDS", "3600"))
+    )
+
+
+# columnar export
+
+def read_log(path):
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def flatten(record):
+    """One flat row per session: stage timings become stage_<name>_seconds, lists / dicts JSON strings."""
+    row = {}
+    for key, value in record.items():
+        if key == "stages":
+            for name, seconds in value.items():
+                row[f"stage_{name}_seconds"] = seconds
+        elif isinstance(value, (list, dict)):
+            row[key] = json.dumps(value, ensure_ascii=False)
+        else:
+            row[key] = value
+    return row
+
+
+def _columns(rows):
+    columns = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    return list(columns)
+
+
+def export(log_path, out_path):
+    """
+    Write the log as a table to out_path. A .parquet path needs pyarrow and
+    falls back to a .csv next to it. Returns the path that was written.
+    """
+    rows = [flatten(record) for record in read_log(log_path)]
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    columns = _columns(rows)
+
+    if out_path.suffix == ".parquet":
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            logger.warning("pyarrow not installed, exporting CSV instead of Parquet")
+            out_path = out_path.with_suffix(".csv")
+        else:
+            table = pa.Table.from_pylist([{c: row.get(c) for c in columns} for row in rows])
+            tmp = out_path.with_suffix(".parquet.tmp")
+            pq.write_table(table, tmp)
+            os.replace(tmp, out_path)
+            return out_path
+
+    tmp = out_path.with_suffix(out_path.suffix + ".tmp")
+    with open(tmp, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(tmp, out_path)
+    return out_path
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return value if value != "" else None
+
+
+def load_rows(path):
+    """Flat rows from a JSONL log or one of its exports."""
+    path = Path(path)
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    if path.suffix == ".csv":
+        with open(path, "r", newline="") as f:
+            return [{key: _number(value) for key, value in row.items()} for row in csv.DictReader(f)]
+    return [flatten(record) for record in read_log(path)]
+
+
+# aggregates
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def latency_percentiles(rows, quantiles=(0.5, 0.95, 0.99)):
+    """{stage: {"sessions", "p50", "p95", "p99"}} over the sessions that ran the stage, plus "total"."""
+    columns = {"total": "seconds"}
+    for column in _columns(rows):
+        if column.startswith("stage_") and column.endswith("_seconds"):
+            columns[column[len("stage_"):-len("_seconds")]] = column
+
+    report = {}
+    for name, column in columns.items():
+        values = [row[column] for row in rows if isinstance(row.get(column), (int, float))]
+        if values:
+            report[name] = {"sessions": len(values),
+                            **{f"p{int(q * 100)}": round(percentile(values, q), 3) for q in quantiles}}
+    return report
+
+
+def count(rows, column):
+    return dict(Counter(row.get(column) for row in rows).most_common())
+
+
+def summary(rows):
+    return {
+        "sessions": len(rows),
+        "levels": count(rows, "level"),
+        "stop_reasons": count(rows, "stop_reason"),
+        "latency": latency_percentiles(rows),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and query the triage outcome log")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="write the log as Parquet (or CSV)")
+    export_parser.add_argument("log")
+    export_parser.add_argument("out")
+
+    summary_parser = commands.add_parser("summary", help="level distribution and latency percentiles")
+    summary_parser.add_argument("path", help="the JSONL log or an export of it")
+
+    count_parser = commands.add_parser("count", help="sessions per value of a column")
+    count_parser.add_argument("path", help="the JSONL log or an export of it")
+    count_parser.add_argument("--by", required=True)
+
+    args = parser.parse_args()
+    if args.command == "export":
+        print(export(args.log, args.out))
+    elif args.command == "summary":
+        print(json.dumps(summary(load_rows(args.path)), indent=2))
+    else:
+        print(json.dumps(count(load_rows(args.path), args.by), indent=2, ensure_ascii=False))
@@ -1,27 +1,24 @@
-import ollama
-from retriever import loader, embedding, find_similarity, filter_by_metadata
-from state import TriagState
 import json
 import re
-from safety import SafetyDetector
+import sys
+from pathlib import Path
 
+# rag modules import each other as "rag.x", so make the project root importable
+sys.path.append(str(Path(__file__).parent.parent))
 
-def build_context(retrieved_docs):
-    context = ""
+from rag.retriever import loader, embedding, filter_by_metadata, set_embedding_cache
+from rag.condition_index import ConditionIndex
+from rag.state import TriagState
+from rag.safety import SafetyDetector
+from rag.context import build_context
+from rag.llm import LLMClient
+from rag.cassette import client_from_env, fixture_from_env
 
-    for doc in retrieved_docs:
-
-        meta = doc["metadata"]
-
-        context += f"""
-        Condition: {meta['condition']}
-        Section: {meta['section']}
-        Urgency: {meta['urgency']}
-        Information: {doc['text']}
-        ---
-        """
-    print(f"Context : {context}")
-    return context.strip()
+# TRIAGE_LLM_CASSETTE / TRIAGE_EMBED_FIXTURE record or replay model calls (rag/cassette.py)
+llm = client_from_env(LLMClient.from_env)
+embedding_fixture = fixture_from_env()
+if embedding_fixture is not None:
+    set_embedding_cache(embedding_fixture)
 
 
 def build_prompt(user_query, state: TriagState):
@@ -139,11 +136,7 @@ def clean_query(text):
 
 
 def ask_llm(prompt):
-    response = ollama.chat(
-        model= "qwen2.5:7b-instruct",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    return response["message"]["content"]
+    return llm.chat(prompt)["content"]
 
 if __name__ == "__main__":
     confidence = 0.75
@@ -155,6 +148,7 @@ if __name__ == "__main__":
         "../embeddings/vector_store/faiss.index",
         "../embeddings/vector_store/documents.json"
     )
+    conditions = ConditionIndex(index, documents)
 
     state = TriagState()
 
@@ -215,10 +209,11 @@ if __name__ == "__main__":
     print(retrieval_query)
 
     vector = embedding(clean_retrieval_query, "all-MiniLM-L6-v2")
-    retrieved = find_similarity(vector, 5, index, documents)
+    retrieved = conditions.search(vector, 5)
     retrieved = filter_by_metadata(retrieved)
 
-    context = build_context(retrieved)
+    context, context_tokens = build_context(retrieved)
+    print(f"Context ({context_tokens} tokens): {context}")
 
 
     #if state.num_questions == state.max_questions:
@@ -0,0 +1,101 @@
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+from rag.condition_index import ConditionIndex, limit_per_condition
+from rag.retriever import loader, embedding, rerank, RERANK_MODEL
+
+VECTOR_STORE_DIR = ROOT / "embeddings" / "vector_store"
+EMBED_MODEL = "all-MiniLM-L6-v2"
+
+
+def score(retrieved, expected):
+    """(hit, reciprocal rank, precision) of one ranked list against the expected conditions."""
+    relevant = [doc["metadata"]["condition"].lower() in expected for doc in retrieved]
+    first = relevant.index(True) + 1 if True in relevant else None
+    return (
+        first is not None,
+        1 / first if first else 0.0,
+        sum(relevant) / len(retrieved) if retrieved else 0.0,
+    )
+
+
+def summarize(rows, prefix):
+    return {
+        "hit_rate": sum(r[f"{prefix}_hit"] for r in rows) / len(rows),
+        "mrr": sum(r[f"{prefix}_rr"] for r in rows) / len(rows),
+        "precision": sum(r[f"{prefix}_precision"] for r in rows) / len(rows),
+        "latency": sum(r[f"{prefix}_latency"] for r in rows) / len(rows),
+    }
+
+
+def evaluate(conditions, cases, embed_model=EMBED_MODEL, k=5, candidates=20, top_conditions=3,
+             max_per_condition=2, rerank_model=None, time_budget=None):
+    """
+    Compare plain vector retrieval with over-fetch + cross-encoder rerank.
+    cases is a list of {"query": ..., "conditions": [expected condition, ...]};
+    a retrieved chunk counts as relevant when its condition is expected.
+    """
+    rows = []
+    for case in cases:
+        expected = {c.lower() for c in case["conditions"]}
+        vector = embedding(case["query"], embed_model)
+
+        start = time.perf_counter()
+        baseline = conditions.search(vector, k, top_conditions=top_conditions, max_per_condition=max_per_condition)
+        row = {"query": case["query"], "baseline_latency": time.perf_counter() - start}
+        row["baseline_hit"], row["baseline_rr"], row["baseline_precision"] = score(baseline, expected)
+
+        if rerank_model:
+            start = time.perf_counter()
+            pool = conditions.search(vector, candidates, top_conditions=top_conditions, max_per_condition=candidates)
+            reranked, scores = rerank(case["query"], pool, len(pool), rerank_model, time_budget=time_budget)
+            reranked = limit_per_condition(reranked, k, max_per_condition)
+            row["rerank_latency"] = time.perf_counter() - start
+            row["rerank_skipped"] = scores is None
+            row["rerank_hit"], row["rerank_rr"], row["rerank_precision"] = score(reranked, expected)
+
+        rows.append(row)
+
+    if not rows:
+        return {"cases": 0}
+
+    report = {"cases": len(rows), "k": k, "baseline": summarize(rows, "baseline")}
+    if rerank_model:
+        report["rerank"] = summarize(rows, "rerank")
+        report["rerank"]["skipped"] = sum(r["rerank_skipped"] for r in rows)
+    report["rows"] = rows
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality with and without reranking")
+    parser.add_argument("cases", help="JSONL file of {query, conditions}")
+    parser.add_argument("--store", default=str(VECTOR_STORE_DIR), help="vector store directory")
+    parser.add_argument("--model", default=EMBED_MODEL)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=20, help="chunks over-fetched for reranking")
+    parser.add_argument("--rerank-model", nargs="?", const=RERANK_MODEL, default=None,
+                        help=f"enable reranking (default model: {RERANK_MODEL})")
+    parser.add_argument("--budget-ms", type=float, default=None, help="rerank time budget")
+    parser.add_argument("--rows", action="store_true", help="print per query results")
+    args = parser.parse_args()
+
+    with open(args.cases, "r") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    store = Path(args.store)
+    index, documents = loader(str(store / "faiss.index"), str(store / "documents.json"))
+    report = evaluate(
+        ConditionIndex(index, documents), cases, args.model, args.k, args.candidates,
+        rerank_model=args.rerank_model,
+        time_budget=args.budget_ms / 1000 if args.budget_ms else None
+    )
+    if not args.rows:
+        report.pop("rows", None)
+    print(json.dumps(report, indent=2))
@@ -1,26 +1,95 @@
-import faiss
 import json
-from sentence_transformers import SentenceTransformer
+import logging
 import os
+import re
+import sys
+import time
+from pathlib import Path
+import numpy as np
 os.environ["TRANSFORMERS_NO_TF"] = "1"
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from rag.embed_cache import EmbeddingCache
+from rag.threads import apply_faiss_threads
+
+logger = logging.getLogger(__name__)
+
+# small cross-encoder used by rerank, scores (query, chunk) pairs jointly
+RERANK_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+# Heavy libraries (faiss, sentence_transformers) are imported inside the
+# functions that need them so importing this module stays cheap.
+_models = {}
+_cross_encoders = {}
+
+# Repeated texts ("yes", "2 days", the same complaint) are embedded once;
+# the API may swap in a cache with a shared tier via set_embedding_cache
+_embedding_cache = EmbeddingCache()
+
+URGENCY_CODES = {"high": 0, "medium": 1, "low": 2}
+
+# phrases that state a symptom is absent, they must not be searched for
+NEGATIONS = ("no ", "not ", "without ", "denies ", "never ")
+
+
 def loader(index_path, documents_path):
+    import faiss
+
     index = faiss.read_index(index_path)
 
     with open(documents_path, "r") as f:
         documents = json.load(f)
+    if len(documents) != index.ntotal:
+        raise ValueError(f"{documents_path} has {len(documents)} documents for {index.ntotal} vectors")
 
     return index, documents
 
 
+def get_model(model):
+    # loading a SentenceTransformer takes seconds, so keep one per model name
+    if model not in _models:
+        from sentence_transformers import SentenceTransformer
+        _models[model] = SentenceTransformer(model)
+    return _models[model]
+
+
+def get_cross_encoder(model=RERANK_MODEL):
+    if model not in _cross_encoders:
+        from sentence_transformers import CrossEncoder
+        _cross_encoders[model] = CrossEncoder(model)
+    return _cross_encoders[model]
+
+
+def set_embedding_cache(cache):
+    """Use cache (an EmbeddingCache, or None to disable caching) for embed_texts."""
+    global _embedding_cache
+    _embedding_cache = cache
+
+
+def get_embedding_cache():
+    return _embedding_cache
+
+
+def embed_texts(texts, model):
+    """Embed a batch of texts as a 2D array, going through the embedding cache."""
+    def encode(batch):
+        return get_model(model).encode(batch, convert_to_numpy=True)
+
+    if _embedding_cache is None:
+        return encode(list(texts))
+    return _embedding_cache.encode(texts, model, encode)
+
+
 def embedding(query, model):
 
-    model = SentenceTransformer(model)
     # FAISS expected 2D array so query has to be shape:(1,dim)
-    query_vector = model.encode([query], convert_to_numpy=True)
+    query_vector = embed_texts([query], model)
     return query_vector
 
 def find_similarity(query_vector, k, index, documents):
 
+    apply_faiss_threads()
     distances, indices = index.search(query_vector, k)
     result = []
     for ind in indices[0]:
@@ -56,6 +125,166 @@ def filter_by_metadata(results, max_docs = 6):
     return final
 
 
+def rerank(query, documents, k, model=RERANK_MODEL, time_budget=None, batch_size=16):
+    """
+    Reorder over-fetched candidates by cross-encoder score and keep the top k.
+
+    Pairs are scored batch by batch; if time_budget (seconds) runs out before
+    every candidate is scored, reranking is skipped and the first k
+    candidates are returned in their original order.
+
+    Returns (documents, scores), scores is None when reranking was skipped.
+    """
+    if not documents:
+        return [], None
+
+    start = time.perf_counter()
+    encoder = get_cross_encoder(model)
+    pairs = [(query, doc["text"]) for doc in documents]
+
+    scores = []
+    for i in range(0, len(pairs), batch_size):
+        if time_budget is not None and time.perf_counter() - start > time_budget:
+            logger.warning("Rerank budget of %.0f ms exceeded after %d/%d candidates, skipping",
+                           time_budget * 1000, len(scores), len(pairs))
+            return documents[:k], None
+        scores.extend(encoder.predict(pairs[i:i + batch_size], batch_size=batch_size))
+
+    order = np.argsort(-np.asarray(scores), kind="stable")[:k]
+    return [documents[i] for i in order], [float(scores[i]) for i in order]
+
+
+def encode_metadata(documents):
+    """
+    Integer coded metadata aligned with the index rows, so filters and
+    urgency bucketing can run on NumPy arrays instead of dicts.
+    """
+    conditions = {}
+    sections = {}
+    urgency = np.empty(len(documents), dtype=np.int8)
+    condition_ids = np.empty(len(documents), dtype=np.int32)
+    section_ids = np.empty(len(documents), dtype=np.int32)
+
+    for row, doc in enumerate(documents):
+        meta = doc["metadata"]
+        urgency[row] = URGENCY_CODES.get(meta["urgency"], 2)
+        condition_ids[row] = conditions.setdefault(meta["condition"], len(conditions))
+        section_ids[row] = sections.setdefault(meta["section"], len(sections))
+
+    return {
+        "urgency": urgency,
+        "condition": condition_ids,
+        "section": section_ids,
+        "conditions": list(conditions),
+        "sections": list(sections),
+    }
+
+
+def search_batch(query_matrix, k, index, documents, metadata=None, filters=None, max_docs=6, quotas=None):
+    """
+    Search many queries with a single FAISS call.
+
+    filters: {"exclude_sections": [...], "urgency": ["high", ...]} drops rows
+    before bucketing. Results are then ordered high > medium > low urgency
+    (ties keep the distance order) and cut like filter_by_metadata: every
+    high urgency hit is kept and the rest fill up to max_docs. quotas, e.g.
+    {"high": 3, "low": 1}, caps the hits taken from an urgency bucket.
+
+    Returns (documents, distances): one list of documents and one array of
+    distances per query.
+    """
+    metadata = metadata or encode_metadata(documents)
+    filters = filters or {}
+    query_matrix = np.ascontiguousarray(query_matrix, dtype="float32")
+    apply_faiss_threads()
+    distances, ids = index.search(query_matrix, k)
+
+    valid = ids >= 0
+    safe_ids = np.where(valid, ids, 0)
+    codes = metadata["urgency"][safe_ids].astype(np.int64)
+
+    if filters.get("exclude_sections"):
+        excluded = [metadata["sections"].index(s) for s in filters["exclude_sections"] if s in metadata["sections"]]
+        valid &= ~np.isin(metadata["section"][safe_ids], excluded)
+    if filters.get("urgency"):
+        allowed = [URGENCY_CODES[u] for u in filters["urgency"]]
+        valid &= np.isin(codes, allowed)
+
+    # filtered rows go to a bucket after "low" and are never returned
+    codes = np.where(valid, codes, len(URGENCY_CODES))
+    order = np.argsort(codes * k + np.arange(k), axis=1, kind="stable")
+    sorted_codes = np.take_along_axis(codes, order, axis=1)
+
+    # position of each hit inside its urgency bucket
+    one_hot = sorted_codes[..., None] == np.arange(len(URGENCY_CODES) + 1)
+    rank_in_bucket = (np.cumsum(one_hot, axis=1) - 1)[one_hot].reshape(sorted_codes.shape)
+
+    keep = sorted_codes < len(URGENCY_CODES)
+    if quotas:
+        limits = np.full(len(URGENCY_CODES) + 1, k)
+        for urgency, limit in quotas.items():
+            limits[URGENCY_CODES[urgency]] = limit
+        keep &= rank_in_bucket < limits[sorted_codes]
+
+    # like filter_by_metadata: all high urgency hits, then fill up to max_docs
+    position = np.cumsum(keep, axis=1) - 1
+    keep &= (sorted_codes == URGENCY_CODES["high"]) | (position < max_docs)
+
+    sorted_ids = np.take_along_axis(ids, order, axis=1)
+    sorted_distances = np.take_along_axis(distances, order, axis=1)
+
+    results = []
+    result_distances = []
+    for row_ids, row_distances, row_keep in zip(sorted_ids, sorted_distances, keep):
+        results.append([documents[i] for i in row_ids[row_keep]])
+        result_distances.append(row_distances[row_keep])
+
+    return results, result_distances
+
+
+
+def split_symptoms(text, max_phrases=6):
+    """
+    Split a symptom list or free text ("headache, fever and a stiff neck")
+    into one search phrase per symptom, dropping negated ones.
+    """
+    # "or" is not a separator: in "no fever or rash" both are negated
+    parts = re.split(r"[,;.\n]|\band\b|\bbut\b|\bwith\b|\balso\b|\bplus\b", text.lower())
+    phrases = []
+    for part in parts:
+        phrase = " ".join(part.split())
+        if len(phrase) < 3 or phrase.startswith(NEGATIONS) or phrase in phrases:
+            continue
+        phrases.append(phrase)
+    return phrases[:max_phrases]
+
+
+def doc_key(doc):
+    meta = doc["metadata"]
+    return (meta["condition"], meta["section"], meta.get("chunk"), doc["text"])
+
+
+def doc_id(doc):
+    """condition/section[/chunk] of a chunk, for logs and reports"""
+    meta = doc["metadata"]
+    return "/".join(str(meta[key]) for key in ("condition", "section", "chunk") if key in meta)
+
+
+def fuse_rankings(rankings, k=60):
+    """
+    Reciprocal rank fusion: merge several ranked document lists (one per
+    query) into one, scoring each document sum(1 / (k + rank)). Ranks are
+    used instead of distances, which are not comparable across queries.
+    """
+    scores = {}
+    docs = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
 
 if __name__ == "__main__":
     index, document = loader("../embeddings/vector_store/faiss.index", "../embeddings/vector_store/documents.json" )
@@ -68,4 +297,3 @@ if __name__ == "__main__":
         print("----")
         print("TEXT:", r["text"])
         print("METADATA:", r["metadata"])
-
@@ -9,35 +9,43 @@ def cosine_similarity(a, b):
 
 
 class SafetyDetector:
-    def __init__(self, embed_fn, threshold=0.85):
+    def __init__(self, embed_fn, threshold=0.85, concept_matrix=None, concept_levels=None):
         self.embed_fn = embed_fn
         self.threshold = threshold
 
-        # High-level emergency concepts (NOT user phrases)
-        self.emergency_concepts = {
-            "call_911": [
-                "severe chest pain and shortness of breath",
-                "heart attack symptoms",
-                "cannot breathe",
-                "sudden loss of consciousness",
-                "suicidal thoughts or intent",
-                "paralysis or sudden numbness",
-                "severe uncontrolled bleeding"
-            ]
-        }
-
-        # Precompute embeddings ONCE
-        self.emergency_vectors = {
-            level: [self.embed_fn(text) for text in texts]
-            for level, texts in self.emergency_concepts.items()
-        }
+        if concept_matrix is None:
+            # No precomputed matrix: embed the concepts from the data file
+            from rag.concepts import load_concepts, flatten_concepts, normalize_rows
 
-    def check(self, text: str):
-        vec = self.embed_fn(text)
+            concept_levels, texts = flatten_concepts(load_concepts())
+            concept_matrix = normalize_rows(
+                np.vstack([np.asarray(self.embed_fn(text)).reshape(1, -1) for text in texts])
+            )
+
+        # one normalized row per emergency concept (NOT user phrases),
+        # so a single matrix product gives every cosine similarity
+        self.concept_matrix = concept_matrix
+        self.concept_levels = list(concept_levels)
+
+    def scores(self, text: str):
+        vec = np.asarray(self.embed_fn(text), dtype="float32").flatten()
+        norm = np.linalg.norm(vec)
+        if norm == 0:
+            return np.zeros(len(self.concept_levels), dtype="float32")
+        return self.concept_matrix @ (vec / norm)
 
-        for level, vectors in self.emergency_vectors.items():
-            for ref_vec in vectors:
-                if cosine_similarity(vec, ref_vec) >= self.threshold:
-                    return level
+    def assess(self, text: str):
+        """Return (level or None, highest similarity to any emergency concept)."""
+        sims = self.scores(text)
+        if not len(sims):
+            return None, 0.0
 
-        return None
+        best = int(np.argmax(sims))
+        score = float(sims[best])
+        if score >= self.threshold:
+            return self.concept_levels[best], score
+
+        return None, score
+
+    def check(self, text: str):
+        return self.assess(text)[0]
@@ -0,0 +1,155 @@
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from rag.llm import LLMError, LLMTimeout
+
+# Priority classes, most urgent first, and their weighted fair queueing shares
+PRIORITIES = ("emergency", "urgent", "routine")
+WEIGHTS = {"emergency": 8, "urgent": 3, "routine": 1}
+
+# Set per request by the API; every LLM call made while handling the
+# request is queued with this priority
+current_priority = contextvars.ContextVar("current_priority", default="routine")
+
+
+class QueueFull(LLMError):
+    """The LLM queue is full and the request's priority may be shed."""
+
+
+def priority_for(safety_score, red_flag_hits):
+    """
+    Map the SafetyDetector similarity (max over emergency concepts) and the
+    number of red flag keywords in the conversation to a priority class.
+    """
+    if safety_score >= 0.7 or red_flag_hits >= 2:
+        return "emergency"
+    if safety_score >= 0.5 or red_flag_hits >= 1:
+        return "urgent"
+    return "routine"
+
+
+def count_red_flags(text, red_flags):
+    text = text.lower()
+    return sum(1 for flag in red_flags if flag in text)
+
+
+class _Waiter:
+    def __init__(self, priority):
+        self.priority = priority
+        self.event = threading.Event()
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """
+    Limits concurrent LLM calls and orders the waiting ones with weighted
+    fair queueing over the priority classes: each class gets a share of the
+    slots proportional to its weight, so emergencies go first under load
+    but routine requests are not starved. When the queue is longer than
+    max_queue, requests of the shed classes are rejected straight away.
+    """
+
+    def __init__(self, max_concurrent=4, max_queue=32, weights=WEIGHTS, shed=("routine",)):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.weights = weights
+        self.shed = set(shed)
+
+        self._lock = threading.Lock()
+        self._running = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish = {p: 0.0 for p in weights}
+
+        self._waits = {p: deque(maxlen=1000) for p in weights}
+        self._served = {p: 0 for p in weights}
+        self._rejected = {p: 0 for p in weights}
+        self._timed_out = {p: 0 for p in weights}
+
+    def _queued(self):
+        return sum(1 for *_, w in self._heap if not w.cancelled)
+
+    def _enqueue(self, waiter):
+        # virtual finish time: a class with weight w advances by 1/w per request
+        start = max(self._virtual_time, self._last_finish[waiter.priority])
+        finish = start + 1.0 / self.weights[waiter.priority]
+        self._last_finish[waiter.priority] = finish
+        heapq.heappush(self._heap, (finish, next(self._seq), waiter))
+
+    def _dispatch(self):
+        # called with the lock held: hand free slots to the earliest finishers
+        while self._running < self.max_concurrent and self._heap:
+            finish, _, waiter = heapq.heappop(self._heap)
+            if waiter.cancelled:
+                continue
+            self._virtual_time = finish
+            self._running += 1
+            waiter.event.set()
+
+    def acquire(self, priority, timeout=None):
+        priority = priority if priority in self.weights else "routine"
+        start = time.monotonic()
+        with self._lock:
+            if self._running < self.max_concurrent and not self._queued():
+                self._running += 1
+                self._record(priority, 0.0)
+                return
+            if self._queued() >= self.max_queue and priority in self.shed:
+                self._rejected[priority] += 1
+                raise QueueFull(f"LLM queue is full ({self.max_queue}), try again later")
+            waiter = _Waiter(priority)
+            self._enqueue(waiter)
+
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.event.is_set():
+                    waiter.cancelled = True
+                    self._timed_out[priority] += 1
+                    raise LLMTimeout("Timed out waiting for an LLM slot")
+
+        with self._lock:
+            self._record(priority, time.monotonic() - start)
+
+    def release(self):
+        with self._lock:
+            self._running -= 1
+            self._dispatch()
+
+    def _record(self, priority, wait):
+        self._served[priority] += 1
+        self._waits[priority].append(wait)
+
+    @contextmanager
+    def slot(self, priority=None, timeout=None):
+        self.acquire(priority or current_priority.get(), timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def metrics(self):
+        with self._lock:
+            classes = {}
+            for p in self.weights:
+                waits = sorted(self._waits[p])
+                classes[p] = {
+                    "queued": sum(1 for *_, w in self._heap if w.priority == p and not w.cancelled),
+                    "served": self._served[p],
+                    "rejected": self._rejected[p],
+                    "timed_out": self._timed_out[p],
+                    "wait_p50": waits[len(waits) // 2] if waits else 0.0,
+                    "wait_p95": waits[int(len(waits) * 0.95)] if waits else 0.0,
+                    "wait_max": waits[-1] if waits else 0.0,
+                }
+            return {
+                "running": self._running,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "classes": classes,
+            }
@@ -0,0 +1,238 @@
+import argparse
+import heapq
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+from rag.threads import apply_faiss_threads
+
+MANIFEST_NAME = "manifest.json"
+
+
+def shard_for(doc, num_shards, by="condition"):
+    """
+    Stable shard number of a document. "condition" keeps all sections of a
+    condition in one shard, "chunk" spreads chunks evenly by their text.
+    """
+    key = doc["metadata"]["condition"] if by == "condition" else doc["text"]
+    return zlib.crc32(key.encode("utf-8")) % num_shards
+
+
+def new_version_dir(out_dir):
+    version = time.strftime("%Y%m%d-%H%M%S")
+    name, n = version, 1
+    while (out_dir / name).exists():
+        name = f"{version}-{n}"
+        n += 1
+    return name
+
+
+def prune_versions(out_dir, current, keep):
+    """Delete all but the newest keep version directories, never current."""
+    versions = [p for p in out_dir.iterdir() if p.is_dir() and p.name != current and any(p.glob("shard-*.index"))]
+    versions.sort(key=lambda p: p.stat().st_mtime_ns)
+    for path in versions[:max(len(versions) - (keep - 1), 0)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def build_sharded_store(documents, out_dir, num_shards, by="condition",
+                        model_name="all-MiniLM-L6-v2", batch_size=256, dedup=None, keep_versions=3):
+    """
+    Embed documents (any iterable) batch by batch into num_shards flat L2
+    indexes and write a manifest describing them. dedup (a
+    rag.dedup.NearDuplicateFilter) drops near-duplicate chunks across shards.
+
+    Shards go into a new version directory under out_dir and only the
+    manifest.json in out_dir is replaced (atomically) at the end, so a
+    running API never reads a half written store or files of two builds.
+    The newest keep_versions version directories are kept.
+    """
+    from rag.embedder import batched
+    from rag.retriever import get_model
+
+    root = Path(out_dir)
+    version = new_version_dir(root)
+    out_dir = root / version
+    out_dir.mkdir(parents=True)
+    model = get_model(model_name)
+
+    indexes = [None] * num_shards
+    doc_files = [open(out_dir / f"shard-{i:03d}.json", "w") for i in range(num_shards)]
+    counts = [0] * num_shards
+    conditions = [set() for _ in range(num_shards)]
+
+    for f in doc_files:
+        f.write("[\n")
+    for batch in batched(documents, batch_size):
+        embeddings = model.encode([doc["text"] for doc in batch], convert_to_numpy=True)
+        if dedup is not None:
+            keep = dedup.filter(batch, embeddings)
+            batch = [doc for doc, kept in zip(batch, keep) if kept]
+            embeddings = embeddings[keep]
+        targets = np.array([shard_for(doc, num_shards, by) for doc in batch])
+        for i in np.unique(targets):
+            rows = np.flatnonzero(targets == i)
+            if indexes[i] is None:
+                indexes[i] = faiss.IndexFlatL2(embeddings.shape[1])
+            indexes[i].add(embeddings[rows])
+            for row in rows:
+                doc = batch[row]
+                doc_files[i].write((",\n" if counts[i] else "") + json.dumps(doc, ensure_ascii=False))
+                counts[i] += 1
+                conditions[i].add(doc["metadata"]["condition"])
+
+    shards = []
+    dimension = None
+    for i, (f, index) in enumerate(zip(doc_files, indexes)):
+        f.write("\n]\n")
+        f.close()
+        if index is None:
+            (out_dir / f"shard-{i:03d}.json").unlink()
+            continue
+        dimension = index.d
+        faiss.write_index(index, str(out_dir / f"shard-{i:03d}.index"))
+        shards.append({
+            "name": f"shard-{i:03d}",
+            # relative to the manifest
+            "index": f"{version}/shard-{i:03d}.index",
+            "documents": f"{version}/shard-{i:03d}.json",
+            "count": counts[i],
+            "conditions": sorted(conditions[i]),
+        })
+
+    manifest = {
+        # shown by the API as the active index version after a reload
+        "version": version,
+        "model": model_name,
+        "dimension": dimension,
+        "metric": "l2",
+        "partition": by,
+        "shards": shards,
+    }
+    tmp = root / f"{MANIFEST_NAME}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, root / MANIFEST_NAME)
+    prune_versions(root, version, keep_versions)
+    return manifest
+
+
+class ShardedIndex:
+    """
+    Vector store split into several FAISS indexes described by a manifest.
+    Shards are loaded the first time they are searched (or all at once with
+    load_all), and a query is run
+    against all shards in parallel threads (FAISS releases the GIL during
+    search) before the per-shard top-k lists are merged.
+    """
+
+    def __init__(self, store_dir, max_workers=None):
+        self.store_dir = Path(store_dir)
+        with open(self.store_dir / MANIFEST_NAME, "r") as f:
+            self.manifest = json.load(f)
+        self.shards = self.manifest["shards"]
+
+        self._loaded = [None] * len(self.shards)
+        self._locks = [threading.Lock() for _ in self.shards]
+        self._pool = ThreadPoolExecutor(max_workers=max_workers or len(self.shards) or 1,
+                                        thread_name_prefix="shard-search")
+
+    @property
+    def ntotal(self):
+        return sum(shard["count"] for shard in self.shards)
+
+    def load_shard(self, i):
+        if self._loaded[i] is None:
+            with self._locks[i]:
+                if self._loaded[i] is None:
+                    shard = self.shards[i]
+                    index = faiss.read_index(str(self.store_dir / shard["index"]))
+                    with open(self.store_dir / shard["documents"], "r") as f:
+                        documents = json.load(f)
+                    if len(documents) != index.ntotal:
+                        raise ValueError(f"Shard {shard['documents']} has {len(documents)} documents "
+                                         f"for {index.ntotal} vectors")
+                    self._loaded[i] = (index, documents)
+        return self._loaded[i]
+
+    def load_all(self):
+        """Read every shard now, in parallel, instead of on its first search."""
+        list(self._pool.map(self.load_shard, range(len(self.shards))))
+
+    def loaded_shards(self):
+        return [shard["name"] for shard, loaded in zip(self.shards, self._loaded) if loaded]
+
+    def _search_shard(self, i, query_vectors, k):
+        index, documents = self.load_shard(i)
+        apply_faiss_threads()  # runs in a shard-search pool thread
+        distances, ids = index.search(query_vectors, min(k, index.ntotal))
+        return [
+            [(float(d), documents[j]) for d, j in zip(row_d, row_i) if j >= 0]
+            for row_d, row_i in zip(distances, ids)
+        ]
+
+    def search(self, query_vectors, k, shard_ids=None):
+        """
+        Search every shard (or only shard_ids) and return, per query, the
+        merged top-k as a list of (distance, document).
+        """
+        query_vectors = np.ascontiguousarray(query_vectors, dtype="float32")
+        shard_ids = range(len(self.shards)) if shard_ids is None else shard_ids
+        futures = [self._pool.submit(self._search_shard, i, query_vectors, k) for i in shard_ids]
+        per_shard = [f.result() for f in futures]
+
+        return [
+            heapq.nsmallest(k, (hit for shard in per_shard for hit in shard[q]), key=lambda hit: hit[0])
+            for q in range(len(query_vectors))
+        ]
+
+    def close(self):
+        # called by the API's IndexManager when this version is replaced
+        self._pool.shutdown(wait=False)
+
+    def search_documents(self, query_vector, k):
+        """Same contract as retriever.find_similarity: the top-k documents of one query."""
+        return [doc for _, doc in self.search(query_vector, k)[0]]
+
+
+if __name__ == "__main__":
+    from rag.embedder import iter_processed_docs, PROCESSED_DIR, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Build a sharded vector store")
+    parser.add_argument("--processed", default=str(PROCESSED_DIR), help="directory of JSONL shards")
+    parser.add_argument("--out", default=str(ROOT / "embeddings" / "vector_store" / "sharded"))
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--by", choices=["condition", "chunk"], default="condition")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--dedup", type=float, metavar="SIMILARITY",
+                        help="drop chunks at least this cosine similar to an earlier one, e.g. 0.95")
+    parser.add_argument("--dedup-scope", choices=["condition", "section"], default="condition",
+                        help="compare chunks of the same condition (references / sources across conditions), "
+                             "or of the same section across conditions")
+    args = parser.parse_args()
+
+    dedup = None
+    if args.dedup:
+        from rag.dedup import NearDuplicateFilter, REPORT_NAME
+        dedup = NearDuplicateFilter(args.dedup, args.dedup_scope)
+
+    manifest = build_sharded_store(
+        iter_processed_docs(args.processed), args.out, args.shards, args.by, args.model, args.batch_size, dedup
+    )
+    if dedup is not None:
+        dedup.write_report(Path(args.out) / manifest["version"] / REPORT_NAME)
+        print(f"Dropped {len(dedup.removed)} near-duplicate chunks")
+    print(f"{sum(s['count'] for s in manifest['shards'])} documents in {len(manifest['shards'])} shards -> {args.out}")
@@ -1,31 +1,105 @@
+import json
+import struct
+
+from rag.concepts import load_concepts
+
+# red flag / urgent keywords (rag/concepts.json), shared by every session
+RED_FLAGS = tuple(load_concepts()["red_flags"])
+
+# serialization format version, bump when the layout changes
+STATE_VERSION = 1
+
+# binary layout: magic, version, num_questions, max_questions, number of turns,
+# then every question and answer as a length prefixed UTF-8 string
+_MAGIC = b"TS"
+_HEADER = struct.Struct("<2sBHHH")
+_LENGTH = struct.Struct("<I")
+
+
 class TriagState:
-    def __init__(self):
+    __slots__ = ("history", "num_questions", "max_questions", "_memory", "_summary")
+
+    red_flags = RED_FLAGS
+
+    def __init__(self, max_questions=3):
         self.history = []          # [(question, answer)]
         self.num_questions = 0
-        self.max_questions = 3
-      
+        self.max_questions = max_questions
 
-        # red flag / urgent keywords
-        self.red_flags = [
-            "chest pain", "shortness of breath", "difficulty breathing",
-            "loss of consciousness", "suicidal", "self harm",
-            "severe bleeding", "uncontrolled pain"
-        ]
+        # memory / summary strings are extended on add_turn instead of rebuilt
+        self._memory = ""
+        self._summary = ""
 
     def add_turn(self, question, answer):
         self.history.append((question, answer))
         self.num_questions += 1
-       
+
+        turn = f"Q: {question}\nA: {answer}"
+        self._memory = f"{self._memory}\n{turn}" if self._memory else turn
+        self._summary = f"{self._summary} {answer}" if len(self.history) > 1 else answer
 
     def should_continue(self):
-        return self.num_questions < self.max_questions 
+        return self.num_questions < self.max_questions
 
     def build_memory(self):
-        if not self.history:
-            return "None"
-        return "\n".join(
-            f"Q: {q}\nA: {a}" for q, a in self.history
-        )
-    
+        return self._memory or "None"
+
     def build_summary(self):
-        return " ".join([a for q, a in self.history])
+        return self._summary
+
+    # serialization for external session stores
+
+    @classmethod
+    def _restore(cls, history, num_questions, max_questions):
+        state = cls(max_questions)
+        for question, answer in history:
+            state.add_turn(question, answer)
+        state.num_questions = num_questions
+        return state
+
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "history": [list(turn) for turn in self.history],
+            "num_questions": self.num_questions,
+            "max_questions": self.max_questions,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get("version") != STATE_VERSION:
+            raise ValueError(f"Unsupported state version: {data.get('version')}")
+        return cls._restore(data["history"], data["num_questions"], data["max_questions"])
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), separators=(",", ":"), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    def to_bytes(self):
+        parts = [_HEADER.pack(_MAGIC, STATE_VERSION, self.num_questions, self.max_questions, len(self.history))]
+        for turn in self.history:
+            for text in turn:
+                encoded = text.encode("utf-8")
+                parts.append(_LENGTH.pack(len(encoded)))
+                parts.append(encoded)
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, version, num_questions, max_questions, turns = _HEADER.unpack_from(data, 0)
+        if magic != _MAGIC:
+            raise ValueError("Not a serialized TriagState")
+        if version != STATE_VERSION:
+            raise ValueError(f"Unsupported state version: {version}")
+
+        offset = _HEADER.size
+        texts = []
+        for _ in range(turns * 2):
+            (length,) = _LENGTH.unpack_from(data, offset)
+            offset += _LENGTH.size
+            texts.append(bytes(data[offset:offset + length]).decode("utf-8"))
+            offset += length
+        return cls._restore(zip(texts[0::2], texts[1::2]), num_questions, max_questions)
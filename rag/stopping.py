@@ -0,0 +1,106 @@
+import os
+import threading
+
+
+def rank_conditions(hits):
+    """[(distance, document)] chunk hits -> [(condition, best distance)] sorted by distance."""
+    best = {}
+    for distance, doc in hits:
+        condition = doc["metadata"]["condition"]
+        if condition not in best or distance < best[condition]:
+            best[condition] = distance
+    return sorted(best.items(), key=lambda item: item[1])
+
+
+def condition_margin(ranked):
+    """Relative distance gap between the closest and the second closest condition."""
+    if len(ranked) < 2:
+        return 1.0 if ranked else 0.0
+    first, second = ranked[0][1], ranked[1][1]
+    return (second - first) / second if second > 0 else 0.0
+
+
+def urgency_share(documents):
+    """(most common urgency, its share) over the retrieved chunks."""
+    counts = {}
+    for doc in documents:
+        urgency = doc["metadata"]["urgency"]
+        counts[urgency] = counts.get(urgency, 0) + 1
+    if not counts:
+        return None, 0.0
+    urgency = max(counts, key=counts.get)
+    return urgency, counts[urgency] / len(documents)
+
+
+class StoppingPolicy:
+    """
+    Decides after each answer whether another question is worth an LLM call
+    and a round trip to the user. A cheap retrieval over the answers so far
+    is decisive when one condition is clearly closer than the next
+    (relative margin) or when the retrieved chunks agree on a high urgency.
+
+    Question counts are follow-up questions, the initial complaint is not
+    one. mode "fixed" keeps the old behaviour: ask until max_questions.
+    """
+
+    def __init__(self, mode="retrieval", min_questions=1, max_questions=2, margin=0.15,
+                 high_urgency_share=0.6):
+        self.mode = mode
+        self.min_questions = min_questions
+        self.max_questions = max_questions
+        self.margin = margin
+        self.high_urgency_share = high_urgency_share
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            mode=os.environ.get("TRIAGE_STOP_POLICY", "retrieval"),
+            min_questions=int(os.environ.get("TRIAGE_STOP_MIN_QUESTIONS", "1")),
+            max_questions=int(os.environ.get("TRIAGE_MAX_QUESTIONS", "2")),
+            margin=float(os.environ.get("TRIAGE_STOP_MARGIN", "0.15")),
+            high_urgency_share=float(os.environ.get("TRIAGE_STOP_HIGH_URGENCY", "0.6")),
+        )
+
+    def wants_probe(self, questions_asked):
+        """Whether decide() would look at retrieval at this point (skip the search otherwise)."""
+        return self.mode == "retrieval" and self.min_questions <= questions_asked < self.max_questions
+
+    def decide(self, questions_asked, ranked_conditions=(), documents=()):
+        """Return the stop reason, or None to keep asking."""
+        if questions_asked >= self.max_questions:
+            return "max_questions"
+        if not self.wants_probe(questions_asked):
+            return None
+
+        if condition_margin(ranked_conditions) >= self.margin:
+            return "decisive_condition"
+        urgency, share = urgency_share(documents)
+        if urgency == "high" and share >= self.high_urgency_share:
+            return "decisive_urgency"
+        return None
+
+
+class SessionMetrics:
+    """Questions asked per finished session and why the questioning stopped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sessions = 0
+        self.questions = {}
+        self.stop_reasons = {}
+
+    def record(self, questions_asked, reason):
+        with self._lock:
+            self.sessions += 1
+            self.questions[questions_asked] = self.questions.get(questions_asked, 0) + 1
+            self.stop_reasons[reason] = self.stop_reasons.get(reason, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            total = sum(n * count for n, count in self.questions.items())
+            return {
+                "sessions": self.sessions,
+                "mean_questions": total / self.sessions if self.sessions else 0.0,
+                "questions": dict(sorted(self.questions.items())),
+                "stop_reasons": dict(self.stop_reasons),
+            }
@@ -0,0 +1,282 @@
+"""
+CPU thread and affinity settings for the components that share a box:
+PyTorch (sentence-transformers), FAISS's OpenMP pool and the HuggingFace
+tokenizers. By default each of them sizes its pool to every core, and next
+to a local Ollama and several uvicorn workers that oversubscribes the CPU.
+
+    # sweep settings on the real index and print the best throughput
+    python rag/threads.py --torch 1 2 4 --faiss 1 2 --concurrency 2 4 8 --affinity 0-3 0-7
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+sys.path.append(str(ROOT))
+
+# env var -> ThreadConfig argument
+ENV_SETTINGS = {
+    "TRIAGE_TORCH_THREADS": "torch_threads",
+    "TRIAGE_TORCH_INTEROP_THREADS": "torch_interop_threads",
+    "TRIAGE_FAISS_THREADS": "faiss_threads",
+    "TRIAGE_TOKENIZERS_PARALLELISM": "tokenizers_parallelism",
+    "TRIAGE_CPU_AFFINITY": "affinity",
+}
+
+
+# FAISS thread count for searches. omp_set_num_threads only changes the
+# calling thread, and searches run in request and shard pool threads, so
+# every search applies it to its own thread (apply_faiss_threads)
+_faiss_threads = None
+_thread_state = threading.local()
+
+
+def set_faiss_threads(threads):
+    global _faiss_threads
+    _faiss_threads = threads
+    apply_faiss_threads()
+
+
+def apply_faiss_threads():
+    """Apply the configured FAISS thread count to the calling thread; cheap, call before searching."""
+    threads = _faiss_threads
+    if threads and getattr(_thread_state, "faiss_threads", None) != threads and "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(threads)
+        _thread_state.faiss_threads = threads
+
+
+def parse_cpus(spec):
+    """'0-3,8' -> [0, 1, 2, 3, 8]"""
+    cpus = []
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+    return sorted(set(cpus))
+
+
+def pin_process(cpus):
+    """Set the CPU affinity of every thread of this process (Linux), not only the caller's."""
+    task_dir = "/proc/self/task"
+    thread_ids = [int(tid) for tid in os.listdir(task_dir)] if os.path.isdir(task_dir) else [0]
+    for tid in thread_ids:
+        try:
+            os.sched_setaffinity(tid, cpus)
+        except ProcessLookupError:
+            pass  # the thread exited meanwhile
+
+
+def parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+class ThreadConfig:
+    """
+    Settings left as None are not touched. affinity (a CPU list or spec like
+    "0-3") pins every thread of this process, and thread pools created
+    later inherit it. Other processes such as Ollama are pinned from
+    outside, e.g. with taskset.
+    """
+
+    def __init__(self, torch_threads=None, torch_interop_threads=None, faiss_threads=None,
+                 tokenizers_parallelism=None, affinity=None):
+        self.torch_threads = int(torch_threads) if torch_threads else None
+        self.torch_interop_threads = int(torch_interop_threads) if torch_interop_threads else None
+        self.faiss_threads = int(faiss_threads) if faiss_threads else None
+        self.tokenizers_parallelism = parse_bool(tokenizers_parallelism)
+        self.affinity = parse_cpus(affinity) if isinstance(affinity, str) else affinity
+
+    @classmethod
+    def from_env(cls):
+        return cls(**{arg: os.environ.get(var) for var, arg in ENV_SETTINGS.items()})
+
+    def apply(self):
+        """Apply the configured settings; returns {setting: error} for the ones that failed."""
+        errors = {}
+
+        if self.tokenizers_parallelism is not None:
+            # read by the tokenizers library when it first parallelizes
+            os.environ["TOKENIZERS_PARALLELISM"] = "true" if self.tokenizers_parallelism else "false"
+
+        if self.affinity:
+            try:
+                pin_process(self.affinity)
+            except (AttributeError, OSError, ValueError) as e:
+                errors["affinity"] = str(e)
+
+        if self.torch_threads or self.torch_interop_threads:
+            import torch
+            if self.torch_threads:
+                torch.set_num_threads(self.torch_threads)
+            if self.torch_interop_threads:
+                try:
+                    torch.set_num_interop_threads(self.torch_interop_threads)
+                except RuntimeError as e:
+                    # only allowed before the first inter-op parallel work
+                    errors["torch_interop_threads"] = str(e)
+
+        if self.faiss_threads:
+            # faiss is not imported here, searches apply it once it is loaded
+            set_faiss_threads(self.faiss_threads)
+
+        return errors
+
+    def apply_to_thread(self):
+        """The per-thread part of the settings, for thread pool initializers."""
+        if self.torch_threads:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        if self.faiss_threads:
+            import faiss
+            faiss.omp_set_num_threads(self.faiss_threads)
+            _thread_state.faiss_threads = self.faiss_threads
+
+    def as_dict(self):
+        return {
+            "torch_threads": self.torch_threads,
+            "torch_interop_threads": self.torch_interop_threads,
+            "faiss_threads": self.faiss_threads,
+            "tokenizers_parallelism": self.tokenizers_parallelism,
+            "affinity": self.affinity,
+        }
+
+
+def current_settings():
+    """Thread settings in effect right now (only for libraries already imported)."""
+    report = {
+        "cpu_count": os.cpu_count(),
+        "tokenizers_parallelism": os.environ.get("TOKENIZERS_PARALLELISM"),
+    }
+    try:
+        report["affinity"] = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        report["affinity"] = None
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        report["torch_threads"] = torch.get_num_threads()
+        report["torch_interop_threads"] = torch.get_num_interop_threads()
+    report["faiss_threads"] = _faiss_threads
+    if "faiss" in sys.modules:
+        # of the calling thread, after applying the setting like a search does
+        apply_faiss_threads()
+        report["faiss_omp_max_threads"] = sys.modules["faiss"].omp_get_max_threads()
+    return report
+
+
+def run_workload(encode, search, queries, concurrency, initializer=None):
+    """
+    Run every query (encode + search) from concurrency threads, like the
+    API's threadpool; initializer runs in each of them first.
+    """
+    latencies = []
+
+    def one(query):
+        start = time.perf_counter()
+        search(encode(query))
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, initializer=initializer) as pool:
+        list(pool.map(one, queries))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "throughput": len(queries) / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+
+
+def sweep(encode, search, queries, grid, warmup=5):
+    """
+    Benchmark every combination of grid, e.g. {"torch_threads": [1, 2, 4],
+    "faiss_threads": [1, 2], "concurrency": [4, 8]}. Returns the rows sorted
+    by throughput, best first.
+    """
+    names = list(grid)
+    rows = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        settings = dict(zip(names, values))
+        concurrency = settings.pop("concurrency", 1)
+        config = ThreadConfig(**settings)
+        config.apply()
+        # per-thread settings have to be made in the threads that search
+        config.apply_to_thread()
+        for query in queries[:warmup]:
+            search(encode(query))
+
+        result = run_workload(encode, search, queries, concurrency, initializer=config.apply_to_thread)
+        rows.append({**settings, "concurrency": concurrency, **result})
+        print(json.dumps(rows[-1]), file=sys.stderr)
+
+    return sorted(rows, key=lambda row: row["throughput"], reverse=True)
+
+
+SAMPLE_QUERIES = [
+    "headache and fever for two days",
+    "chest pain when breathing deeply",
+    "sore throat and cough",
+    "stomach ache after eating",
+    "rash on arms that itches",
+    "dizzy and tired all the time",
+    "back pain after lifting boxes",
+    "shortness of breath at night",
+]
+
+
+if __name__ == "__main__":
+    from rag.retriever import loader, get_model
+    from rag.condition_index import ConditionIndex
+
+    parser = argparse.ArgumentParser(description="Sweep CPU thread settings for encode + search")
+    parser.add_argument("--store", default=str(ROOT / "embeddings" / "vector_store"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--queries", help="text file with one query per line (default: built-in samples)")
+    parser.add_argument("--repeat", type=int, default=25, help="times the query list is run per setting")
+    parser.add_argument("--torch", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--faiss", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--affinity", nargs="+", default=None, help="CPU sets to try, e.g. 0-3 0-7")
+    parser.add_argument("--tokenizers-parallelism", choices=["true", "false"], default="false")
+    args = parser.parse_args()
+
+    if args.queries:
+        with open(args.queries, "r") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = SAMPLE_QUERIES
+    queries = queries * args.repeat
+
+    # the tokenizer reads this once, so it is fixed for the whole sweep
+    ThreadConfig(tokenizers_parallelism=args.tokenizers_parallelism).apply()
+    store = Path(args.store)
+    index, documents = loader(str(store / "faiss.index"), str(store / "documents.json"))
+    conditions = ConditionIndex(index, documents)
+    model = get_model(args.model)
+
+    grid = {"torch_threads": args.torch, "faiss_threads": args.faiss, "concurrency": args.concurrency}
+    if args.affinity:
+        grid["affinity"] = args.affinity
+
+    # encode directly, the embedding cache would turn repeated queries into hits
+    rows = sweep(
+        lambda q: model.encode([q], convert_to_numpy=True),
+        lambda v: conditions.search(v, 5),
+        queries,
+        grid
+    )
+    print(json.dumps({"best": rows[0], "rows": rows}, indent=2))
@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+# Pipeline stages that call the LLM
+STAGES = ("question", "query", "final")
+
+CONFIDENCE_WORDS = {"low": 0.3, "medium": 0.6, "high": 0.9}
+ESCALATION_LEVELS = {"call_911", "urgent_gp"}
+
+
+def parse_json(text):
+    match = re.search(r'\{[\s\S]*\}', text or "")
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+
+
+def parse_confidence(result):
+    """Numeric confidence of a question / triage answer, 0.0 if missing."""
+    if not isinstance(result, dict):
+        return 0.0
+    value = result.get("confidence")
+    if isinstance(value, str):
+        return CONFIDENCE_WORDS.get(value.strip().lower(), 0.0)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def proposes_escalation(result):
+    return isinstance(result, dict) and (
+        result.get("type") == "escalate" or result.get("level") in ESCALATION_LEVELS
+    )
+
+
+class ModelTiers:
+    """
+    Which model serves each stage, plus an optional cascade: for the stages
+    in cascade_stages the small model answers first and the large model is
+    only called when the answer is unparsable, below the confidence
+    threshold, or proposes escalation (escalations are always confirmed by
+    the large model). The cascade needs JSON answers with a confidence, so
+    it is meant for the "question" and "final" stages.
+    """
+
+    def __init__(self, models, small_model=None, cascade_stages=(), threshold=0.7):
+        self.models = models
+        self.small_model = small_model
+        self.cascade_stages = set(cascade_stages) if small_model else set()
+        self.threshold = threshold
+
+    @classmethod
+    def from_env(cls):
+        """
+        TRIAGE_MODEL_QUESTION / _QUERY / _FINAL pick the model per stage
+        (unset: the backend model or the client default),
+        TRIAGE_CASCADE_MODEL and TRIAGE_CASCADE_STAGES (comma separated)
+        enable the cascade, TRIAGE_CASCADE_THRESHOLD sets its threshold.
+        """
+        models = {
+            stage: os.environ.get(f"TRIAGE_MODEL_{stage.upper()}")
+            for stage in STAGES
+        }
+        stages = [s for s in os.environ.get("TRIAGE_CASCADE_STAGES", "").split(",") if s]
+        return cls(
+            models,
+            small_model=os.environ.get("TRIAGE_CASCADE_MODEL"),
+            cascade_stages=stages,
+            threshold=float(os.environ.get("TRIAGE_CASCADE_THRESHOLD", "0.7"))
+        )
+
+    def model_for(self, stage):
+        # None lets LLMClient use the backend's model or its default model
+        return self.models.get(stage)
+
+    def needs_large_model(self, result):
+        return (
+            result is None
+            or proposes_escalation(result)
+            or parse_confidence(result) < self.threshold
+        )
+
+    def ask(self, llm, prompt, stage, **kwargs):
+        """
+        Run prompt for stage through llm (an LLMClient). Returns the response
+        dict of the model that was finally used, with "cascade" set to
+        "small", "large" (small model overruled) or None (no cascade).
+        """
+        if stage not in self.cascade_stages:
+            response = llm.chat(prompt, model=self.model_for(stage), **kwargs)
+            response["cascade"] = None
+            return response
+
+        # the small model's answer may be overruled, so only the large model streams
+        small_kwargs = {k: v for k, v in kwargs.items() if k != "on_token"}
+        small = llm.chat(prompt, model=self.small_model, **small_kwargs)
+        if not self.needs_large_model(parse_json(small["content"])):
+            small["cascade"] = "small"
+            return small
+
+        if kwargs.get("timeout") is not None:
+            # the small model's time counts against the same stage budget
+            kwargs["timeout"] = max(0.0, kwargs["timeout"] - small["latency"])
+        large = llm.chat(prompt, model=self.model_for(stage), **kwargs)
+        large["cascade"] = "large"
+        large["latency"] += small["latency"]
+        return large
+
+
+def same_decision(a, b):
+    """Two answers agree when they have the same type and triage level."""
+    if a is None or b is None:
+        return False
+    return a.get("type") == b.get("type") and a.get("level") == b.get("level")
+
+
+def evaluate(llm, tiers, cases):
+    """
+    Compare the cascade with the large-model-only baseline. cases is a list
+    of {"stage": ..., "prompt": ...}; returns agreement and latency figures.
+    """
+    rows = []
+    for case in cases:
+        stage = case["stage"]
+        start = time.perf_counter()
+        baseline = llm.chat(case["prompt"], model=tiers.model_for(stage))
+        baseline_latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        tiered = tiers.ask(llm, case["prompt"], stage)
+        tiered_latency = time.perf_counter() - start
+
+        rows.append({
+            "stage": stage,
+            "agree": same_decision(parse_json(baseline["content"]), parse_json(tiered["content"])),
+            "used": tiered["cascade"],
+            "baseline_latency": baseline_latency,
+            "tiered_latency": tiered_latency,
+        })
+
+    if not rows:
+        return {"cases": 0}
+
+    baseline_total = sum(r["baseline_latency"] for r in rows)
+    tiered_total = sum(r["tiered_latency"] for r in rows)
+    return {
+        "cases": len(rows),
+        "agreement": sum(r["agree"] for r in rows) / len(rows),
+        "small_model_share": sum(r["used"] == "small" for r in rows) / len(rows),
+        "baseline_latency": baseline_total,
+        "tiered_latency": tiered_total,
+        "latency_saved": baseline_total - tiered_total,
+        "rows": rows,
+    }
+
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+    from rag.llm import LLMClient, DEFAULT_MODEL
+
+    parser = argparse.ArgumentParser(description="Evaluate the small/large model cascade")
+    parser.add_argument("cases", help="JSONL file of {stage, prompt}")
+    parser.add_argument("--small-model", required=True)
+    parser.add_argument("--large-model", default=DEFAULT_MODEL)
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+
+    with open(args.cases, "r") as f:
+        cases = [json.loads(line) for line in f if line.strip()]
+
+    tiers = ModelTiers(
+        {stage: args.large_model for stage in STAGES},
+        small_model=args.small_model,
+        cascade_stages=("question", "final"),
+        threshold=args.threshold
+    )
+    report = evaluate(LLMClient.from_env(default_model=args.large_model), tiers, cases)
+    report.pop("rows", None)
+    print(json.dumps(report, indent=2))
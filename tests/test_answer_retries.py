@@ -0,0 +1,90 @@
+import threading
+import time
+import uuid
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException
+
+import app.api as api
+from rag.state import TriagState
+
+
+@pytest.fixture
+def session(monkeypatch):
+    """A session waiting for the answer to Q1; the model is slow and asks Q2 next"""
+    calls = []
+
+    def ask_llm(prompt, stage="final", deadline=None, on_token=None):
+        calls.append(stage)
+        time.sleep(0.2)
+        return '{"type": "ask", "question": "Q2"}'
+
+    monkeypatch.setattr(api, "ask_llm", ask_llm)
+    monkeypatch.setattr(api, "stop_reason", lambda state: None)
+
+    state = TriagState(max_questions=5)
+    state.add_turn("What are your symptoms?", "headache")
+    session_id = str(uuid.uuid4())  # replayed responses are kept by session id
+    api.sessions[session_id] = {
+        "state": state,
+        "completed": False,
+        "result": None,
+        "last_question": "Q1",
+        "question_id": 1,
+        "safety_score": 0.0,
+    }
+    yield session_id, state, calls
+    api.sessions.pop(session_id, None)
+    api.session_locks.discard(session_id)
+
+
+def send(session_id, answers, delay=0.05):
+    """Send the answers from concurrent threads, each a little after the previous one"""
+    results = [None] * len(answers)
+
+    def run(i, answer):
+        try:
+            results[i] = api.run_answer(api.AnswerRequest(session_id=session_id, answer=answer))
+        except HTTPException as e:
+            results[i] = e
+
+    threads = []
+    for i, answer in enumerate(answers):
+        thread = threading.Thread(target=run, args=(i, answer))
+        thread.start()
+        threads.append(thread)
+        time.sleep(delay)
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_retries_without_turn_apply_the_answer_once(session):
+    session_id, state, calls = session
+    results = send(session_id, ["yes"] * 4)
+
+    assert state.history[1:] == [("Q1", "yes")]
+    assert calls == ["question"]
+    assert [r.question for r in results] == ["Q2"] * 4
+    assert api.sessions[session_id]["last_question"] == "Q2"
+
+
+def test_second_answer_to_the_same_question_is_rejected(session):
+    session_id, state, calls = session
+    first, second = send(session_id, ["yes", "no"])
+
+    assert first.question == "Q2"
+    assert isinstance(second, HTTPException) and second.status_code == 409
+    assert state.history[1:] == [("Q1", "yes")]
+
+
+def test_session_lock_dropped_when_session_completes(session):
+    session_id, _, _ = session
+    api.session_locks.get(session_id)
+    api.sessions[session_id]["completed"] = True
+
+    api.run_answer(api.AnswerRequest(session_id=session_id, answer="late"))
+    assert session_id not in api.session_locks._locks
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from rag.dedup import NearDuplicateFilter
+
+
+def doc(condition, section, urgency="low", text=None):
+    return {"text": text or f"{condition} {section}",
+            "metadata": {"condition": condition, "section": section, "urgency": urgency}}
+
+
+def vectors(*rows):
+    """One-hot-ish embeddings: equal names give equal vectors, different ones are orthogonal."""
+    names = sorted(set(rows))
+    out = np.zeros((len(rows), max(len(names), 2)), dtype="float32")
+    for i, name in enumerate(rows):
+        out[i, names.index(name)] = 1.0
+    return out
+
+
+def test_repeat_within_a_condition_is_dropped():
+    dedup = NearDuplicateFilter(0.95)
+    docs = [doc("flu", "overview"), doc("flu", "overview_2")]
+    keep = dedup.filter(docs, vectors("x", "x"))
+    assert keep.tolist() == [True, False]
+    assert dedup.removed[0]["duplicate_of"] == "flu/overview"
+
+
+def test_condition_scope_keeps_cross_condition_duplicates():
+    dedup = NearDuplicateFilter(0.95)
+    keep = dedup.filter([doc("flu", "overview"), doc("cold", "overview")], vectors("x", "x"))
+    assert keep.tolist() == [True, True]
+
+
+def test_references_are_deduplicated_across_conditions_by_default():
+    dedup = NearDuplicateFilter(0.95)
+    docs = [doc("flu", "references"), doc("cold", "references"), doc("cold", "sources"), doc("cold", "overview")]
+    keep = dedup.filter(docs, vectors("x", "x", "x", "x"))
+    assert keep.tolist() == [True, False, True, True]
+    assert dedup.removed[0]["duplicate_of"] == "flu/references"
+
+
+def test_high_urgency_references_are_kept_across_conditions():
+    dedup = NearDuplicateFilter(0.95)
+    docs = [doc("flu", "references"), doc("sepsis", "references", urgency="high")]
+    assert dedup.filter(docs, vectors("x", "x")).all()
+
+
+def test_duplicates_are_found_across_batches():
+    dedup = NearDuplicateFilter(0.95)
+    dedup.filter([doc("flu", "overview")], vectors("x"))
+    keep = dedup.filter([doc("flu", "causes"), doc("flu", "treatment")], np.array([[1, 0], [0, 1]], "float32"))
+    assert keep.tolist() == [False, True]
+
+
+def test_section_scope_collapses_boilerplate_across_conditions():
+    dedup = NearDuplicateFilter(0.95, scope="section")
+    docs = [doc("flu", "references"), doc("cold", "references"), doc("cold", "overview")]
+    keep = dedup.filter(docs, vectors("x", "x", "x"))
+    # a different section is never compared, even with the same vector
+    assert keep.tolist() == [True, False, True]
+
+
+def test_red_flags_are_never_dropped():
+    dedup = NearDuplicateFilter(0.95, scope="section")
+    docs = [doc("meningitis", "red_flags"), doc("sepsis", "red_flags"), doc("sepsis", "red_flags")]
+    keep = dedup.filter(docs, vectors("x", "x", "x"))
+    assert keep.all()
+    assert dedup.removed == []
+
+
+def test_high_urgency_chunks_are_never_dropped():
+    dedup = NearDuplicateFilter(0.95)
+    docs = [doc("stroke", "symptoms"), doc("stroke", "when_to_seek_help", urgency="high")]
+    assert dedup.filter(docs, vectors("x", "x")).all()
+
+
+def test_below_threshold_is_kept():
+    dedup = NearDuplicateFilter(0.95)
+    similar = np.array([[1.0, 0.0], [0.9, 0.436]], dtype="float32")  # cosine 0.9
+    assert dedup.filter([doc("flu", "a"), doc("flu", "b")], similar).all()
+
+
+def test_report_keeps_the_section_of_conditions_with_a_slash():
+    dedup = NearDuplicateFilter(0.95)
+    docs = [doc("hand/foot/mouth", "overview"), doc("hand/foot/mouth", "overview_2")]
+    dedup.filter(docs, vectors("x", "x"))
+    report = dedup.report()
+    assert report["kept"] == 1
+    assert report["removed_by_section"] == {"overview_2": 1}
+    assert report["chunks"][0]["condition"] == "hand/foot/mouth"
+
+
+def test_unknown_scope():
+    with pytest.raises(ValueError):
+        NearDuplicateFilter(0.95, scope="corpus")
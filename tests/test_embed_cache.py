@@ -0,0 +1,28 @@
+import numpy as np
+
+from rag.embed_cache import EmbeddingCache, SQLiteTier
+
+
+def encoder(value):
+    calls = []
+
+    def encode(texts):
+        calls.append(list(texts))
+        return np.full((len(texts), 3), value, dtype="float32")
+    return encode, calls
+
+
+def test_version_separates_vectors_in_the_shared_tier(tmp_path):
+    shared = SQLiteTier(str(tmp_path / "embeddings.db"))
+    old_encode, _ = encoder(1.0)
+    EmbeddingCache(shared=shared, version="1").encode(["chest pain"], "minilm", old_encode)
+
+    new_encode, calls = encoder(2.0)
+    vectors = EmbeddingCache(shared=shared, version="2").encode(["chest pain"], "minilm", new_encode)
+    assert calls == [["chest pain"]]
+    assert vectors.tolist() == [[2.0, 2.0, 2.0]]
+
+    again, calls = encoder(3.0)
+    vectors = EmbeddingCache(shared=shared, version="2").encode(["Chest pain."], "minilm", again)
+    assert calls == []
+    assert vectors.tolist() == [[2.0, 2.0, 2.0]]
@@ -0,0 +1,59 @@
+import json
+import sys
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+
+class FakeModel:
+    """Stands in for a SentenceTransformer: the vector is the text length."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def get_sentence_embedding_dimension(self):
+        return 4
+
+    def encode(self, texts, convert_to_numpy=True):
+        return np.array([[len(text), 1, 0, 0] for text in texts], dtype="float32")
+
+
+@pytest.fixture
+def embedder(monkeypatch):
+    try:
+        import sentence_transformers  # noqa: F401
+    except ImportError:
+        monkeypatch.setitem(sys.modules, "sentence_transformers", types.SimpleNamespace(SentenceTransformer=FakeModel))
+    import rag.embedder as embedder
+    monkeypatch.setattr(embedder, "SentenceTransformer", FakeModel)
+    return embedder
+
+
+def test_more_workers_than_shards(embedder, tmp_path):
+    processed = tmp_path / "processed"
+    processed.mkdir()
+    docs = [{"text": "x" * n, "metadata": {"condition": "flu", "section": f"s{n}"}} for n in range(1, 4)]
+    (processed / "documents-00000.jsonl").write_text("".join(json.dumps(doc) + "\n" for doc in docs))
+
+    out = tmp_path / "store"
+    num_workers = 3
+    counts = [
+        embedder.build_index(embedder.iter_processed_docs(processed, i, num_workers),
+                             out / f"faiss-{i}.index", out / f"documents-{i}.json", allow_empty=True)
+        for i in range(num_workers)
+    ]
+    assert counts == [3, 0, 0]
+
+    assert embedder.merge_worker_outputs(out, num_workers) == 3
+    index = embedder.faiss.read_index(str(out / "faiss.index"))
+    assert index.ntotal == len(json.loads((out / "documents.json").read_text())) == 3
+    assert sorted(p.name for p in out.iterdir()) == ["documents.json", "faiss.index"]
+
+
+def test_empty_build_still_raises_by_default(embedder, tmp_path):
+    with pytest.raises(ValueError):
+        embedder.build_index([], tmp_path / "faiss.index", tmp_path / "documents.json")
+    assert list(tmp_path.iterdir()) == []
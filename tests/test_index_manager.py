@@ -0,0 +1,29 @@
+import time
+
+from app.index_manager import IndexManager
+
+
+def test_watcher_does_not_retry_a_failed_version(tmp_path):
+    store = tmp_path / "documents.json"
+    store.write_text("v1")
+    loads = []
+
+    def load():
+        loads.append(store.read_text())
+        if store.read_text() == "broken":
+            raise ValueError("documents do not match the index")
+        return {}
+
+    manager = IndexManager(load, [store], poll_interval=0.01)
+    manager.reload()
+    manager.start_watching()
+
+    store.write_text("broken")
+    time.sleep(0.3)
+    assert loads == ["v1", "broken"]
+    assert manager.last_error == "documents do not match the index"
+
+    store.write_text("v2")
+    time.sleep(0.3)
+    assert loads == ["v1", "broken", "v2"]
+    assert manager.last_error is None
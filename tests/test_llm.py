@@ -0,0 +1,54 @@
+import time
+
+import httpx
+import pytest
+
+from rag.accounting import Usage, session_turn
+from rag.llm import Backend, LLMClient, LLMTimeout
+
+
+class FakeBackend(Backend):
+    kind = "fake"
+
+    def __init__(self, name, reply=None, error=None, delay=0.0, timeout=120.0):
+        super().__init__("http://fake", name=name, timeout=timeout)
+        self.reply = reply
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    def chat(self, messages, model, timeout=None, max_tokens=None, on_token=None):
+        self.calls += 1
+        time.sleep(min(self.delay, timeout))
+        if self.error is not None:
+            raise self.error
+        return self.reply, 10, 5
+
+
+def test_budget_timeout_keeps_backend_healthy_and_is_counted():
+    slow = FakeBackend("slow", error=httpx.ReadTimeout("timed out"), delay=1.0)
+    spare = FakeBackend("spare", reply="ok")
+    client = LLMClient([slow, spare])
+
+    usage = Usage()
+    with session_turn(usage), pytest.raises(LLMTimeout):
+        client.chat("hi", timeout=0.05)
+
+    assert slow.healthy and slow.failures == 0
+    assert spare.calls == 0  # no failover once the budget is gone
+    assert usage.llm_calls == 1
+    assert usage.llm_seconds >= 0.05
+
+
+def test_backend_errors_fail_over_and_mark_unhealthy():
+    down = FakeBackend("down", error=httpx.ConnectError("refused"))
+    # the backend's own timeout is shorter than the budget: its fault
+    stuck = FakeBackend("stuck", error=httpx.ReadTimeout("timed out"), delay=1.0, timeout=0.05)
+    spare = FakeBackend("spare", reply="ok")
+    client = LLMClient([down, stuck, spare])
+
+    response = client.chat("hi", timeout=5.0)
+
+    assert response["backend"] == "spare"
+    assert not down.healthy and not stuck.healthy
+    assert spare.healthy
@@ -0,0 +1,34 @@
+import logging
+
+from rag.context import _ApproxTokenizer
+from rag.loader import build_corpus, split_chunks
+
+
+def tokens(text):
+    return len(_ApproxTokenizer().encode(text))
+
+
+def test_long_sentence_is_split_between_words():
+    text = "Short one. " + " ".join(["word"] * 100) + "."
+    chunks = split_chunks(text, _ApproxTokenizer(), max_tokens=20)
+    assert all(tokens(chunk) <= 20 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+
+def test_word_longer_than_a_chunk_is_split_by_tokens():
+    url = "https://example.org/" + "a" * 200
+    chunks = split_chunks(f"See {url} for more.", _ApproxTokenizer(), max_tokens=10)
+    assert all(tokens(chunk) <= 10 for chunk in chunks)
+    assert "".join(chunks).replace(" ", "") == f"See{url}formore."
+
+
+def test_failed_files_are_logged(tmp_path, caplog):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    (raw / "broken.json").write_text('{"condition": "flu"}')
+
+    with caplog.at_level(logging.WARNING, logger="rag.loader"):
+        failures = build_corpus(raw, tmp_path / "processed", workers=1, strict=True)
+
+    assert "broken.json" in failures
+    assert "broken.json: missing section 'symptoms'" in caplog.text
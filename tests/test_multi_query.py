@@ -0,0 +1,66 @@
+from rag.retriever import doc_key, fuse_rankings, split_symptoms
+
+
+def doc(condition, section="symptoms", text=None):
+    return {"text": text or f"{condition} {section}", "metadata": {"condition": condition, "section": section}}
+
+
+def test_split_symptom_list():
+    assert split_symptoms("Headache, fever and stiff neck; rash") == ["headache", "fever", "stiff neck", "rash"]
+
+
+def test_split_drops_negated_symptoms():
+    text = "cough, no fever, denies chest pain, without rash, not vomiting, never fainted"
+    assert split_symptoms(text) == ["cough"]
+
+
+def test_negation_after_but_is_dropped():
+    assert split_symptoms("headache but no fever") == ["headache"]
+
+
+def test_negation_covers_an_or_list():
+    assert split_symptoms("no fever or rash") == []
+    assert split_symptoms("sore throat, no fever or rash") == ["sore throat"]
+
+
+def test_split_keeps_words_containing_separators():
+    assert split_symptoms("hand swelling, brandy coloured urine") == ["hand swelling", "brandy coloured urine"]
+
+
+def test_split_drops_duplicates_and_fragments():
+    assert split_symptoms("Fever, fever,  FEVER , a, ok") == ["fever"]
+
+
+def test_split_limits_the_number_of_phrases():
+    assert split_symptoms("a1x, b2x, c3x, d4x", max_phrases=2) == ["a1x", "b2x"]
+    assert split_symptoms("") == []
+
+
+def test_fusion_prefers_chunks_found_by_several_queries():
+    a, b, c = doc("a"), doc("b"), doc("c")
+    fused = fuse_rankings([[a, b, c], [b, c], [c, b]])
+    assert fused == [b, c, a]
+
+
+def test_fusion_ties_keep_first_seen_order():
+    a, b = doc("a"), doc("b")
+    assert fuse_rankings([[a], [b]]) == [a, b]
+    assert fuse_rankings([[b], [a]]) == [b, a]
+
+
+def test_fusion_merges_equal_chunks_from_different_lists():
+    first, second = doc("a"), doc("a")
+    fused = fuse_rankings([[first, doc("b")], [second]])
+    assert len(fused) == 2
+    assert fused[0] is first
+
+
+def test_fusion_keeps_chunks_of_the_same_condition_apart():
+    symptoms, red_flags = doc("a", "symptoms"), doc("a", "red_flags")
+    assert doc_key(symptoms) != doc_key(red_flags)
+    assert fuse_rankings([[symptoms, red_flags]]) == [symptoms, red_flags]
+
+
+def test_fusion_of_nothing():
+    assert fuse_rankings([]) == []
+    assert fuse_rankings([[], []]) == []
@@ -0,0 +1,18 @@
+import json
+
+from rag.outcomes import OutcomeLog
+
+
+def test_unserializable_record_is_dropped_and_writer_keeps_running(tmp_path):
+    log = OutcomeLog(tmp_path / "outcomes.jsonl", flush_interval=0.01)
+
+    log.log({"session_id": "a", "result": object()})
+    log.flush()
+    assert log.dropped == 1
+    assert log.last_error
+
+    log.log({"session_id": "b"})
+    log.flush()
+    assert log.written == 1
+    lines = (tmp_path / "outcomes.jsonl").read_text().splitlines()
+    assert [json.loads(line)["session_id"] for line in lines] == ["b"]
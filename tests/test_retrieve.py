@@ -0,0 +1,35 @@
+import time
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+import app.api as api
+from rag.accounting import Usage, session_turn
+
+
+def test_search_and_rerank_are_timed_as_separate_stages(monkeypatch):
+    docs = [{"text": f"chunk {i}", "metadata": {"condition": f"c{i}", "section": "overview", "urgency": "low"}}
+            for i in range(3)]
+
+    def search(query, phrases=None):
+        time.sleep(0.05)
+        return docs
+
+    def rerank(query, candidates, k, model, time_budget=None):
+        time.sleep(0.1)
+        return candidates[::-1], [0.9, 0.5, 0.1]
+
+    monkeypatch.setattr(api, "search_candidates", search)
+    monkeypatch.setattr(api, "rerank", rerank)
+    monkeypatch.setattr(api, "RERANK_MODEL", "cross-encoder")
+
+    usage = Usage()
+    with session_turn(usage):
+        retrieved, scores = api.retrieve("chest pain")
+
+    assert [doc["text"] for doc in retrieved] == ["chunk 2", "chunk 1", "chunk 0"]
+    assert scores == [0.9, 0.5, 0.1]
+    retrieval, rerank_stage = usage.stages["retrieval"]["seconds"], usage.stages["rerank"]["seconds"]
+    assert 0.05 <= retrieval < 0.1
+    assert rerank_stage >= 0.1
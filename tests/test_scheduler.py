@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from rag.llm import LLMTimeout
+from rag.scheduler import LLMScheduler, QueueFull, priority_for
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("condition not reached")
+        time.sleep(0.001)
+
+
+def queued(scheduler):
+    return sum(c["queued"] for c in scheduler.metrics()["classes"].values())
+
+
+def serve_order(scheduler, priorities):
+    """
+    Queue one waiter per priority behind a held slot (in list order), then
+    free one slot at a time and return the order they were served in.
+    """
+    scheduler.acquire("routine")
+    served = []
+
+    def wait(label, priority):
+        scheduler.acquire(priority)
+        served.append(label)
+
+    threads = []
+    for label, priority in enumerate(priorities):
+        thread = threading.Thread(target=wait, args=(label, priority), daemon=True)
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: queued(scheduler) == label + 1)
+
+    for n in range(len(priorities)):
+        scheduler.release()
+        wait_until(lambda: len(served) == n + 1)
+    for thread in threads:
+        thread.join(1)
+    return [priorities[label] for label in served]
+
+
+def test_free_slot_is_taken_without_queueing():
+    scheduler = LLMScheduler(max_concurrent=2)
+    with scheduler.slot("routine"):
+        with scheduler.slot("emergency"):
+            assert scheduler.metrics()["running"] == 2
+    assert scheduler.metrics()["running"] == 0
+
+
+def test_emergency_overtakes_queued_routine():
+    scheduler = LLMScheduler(max_concurrent=1)
+    assert serve_order(scheduler, ["routine", "routine", "emergency"]) == ["emergency", "routine", "routine"]
+
+
+def test_routine_is_not_starved_by_emergencies():
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = serve_order(scheduler, ["routine"] + ["emergency"] * 16)
+    # weights 8:1, the routine request gets its turn after about 8 emergencies
+    assert order.index("routine") <= 8
+
+
+def test_same_priority_is_first_come_first_served():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire("urgent")
+    served = []
+
+    def wait(label):
+        scheduler.acquire("urgent")
+        served.append(label)
+
+    for label in range(3):
+        threading.Thread(target=wait, args=(label,), daemon=True).start()
+        wait_until(lambda: queued(scheduler) == label + 1)
+    for n in range(3):
+        scheduler.release()
+        wait_until(lambda: len(served) == n + 1)
+    assert served == [0, 1, 2]
+
+
+def test_full_queue_sheds_routine_but_queues_emergency():
+    scheduler = LLMScheduler(max_concurrent=1, max_queue=1)
+    scheduler.acquire("routine")
+    threading.Thread(target=scheduler.acquire, args=("routine",), daemon=True).start()
+    wait_until(lambda: queued(scheduler) == 1)
+
+    with pytest.raises(QueueFull):
+        scheduler.acquire("routine")
+    # not shed: waits for a slot and only gives up at its timeout
+    with pytest.raises(LLMTimeout):
+        scheduler.acquire("emergency", timeout=0.05)
+
+    classes = scheduler.metrics()["classes"]
+    assert classes["routine"]["rejected"] == 1
+    assert classes["emergency"]["rejected"] == 0
+    assert classes["emergency"]["timed_out"] == 1
+
+
+def test_timed_out_waiter_does_not_take_a_slot():
+    scheduler = LLMScheduler(max_concurrent=1)
+    scheduler.acquire("routine")
+    with pytest.raises(LLMTimeout):
+        scheduler.acquire("urgent", timeout=0.01)
+
+    scheduler.release()
+    assert scheduler.metrics()["running"] == 0
+    with scheduler.slot("routine", timeout=0.1):
+        assert scheduler.metrics()["running"] == 1
+
+
+def test_priority_for():
+    assert priority_for(0.8, 0) == "emergency"
+    assert priority_for(0.1, 2) == "emergency"
+    assert priority_for(0.55, 0) == "urgent"
+    assert priority_for(0.1, 1) == "urgent"
+    assert priority_for(0.1, 0) == "routine"
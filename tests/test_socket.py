@@ -0,0 +1,20 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+import app.api as api
+
+
+@pytest.mark.parametrize("frame", ['["start"]', '"start"', "42", "null", "{not json"])
+def test_bad_frames_get_an_error_and_the_socket_stays_open(frame):
+    client = TestClient(api.app)  # no context manager: the startup hook isn't needed
+    with client.websocket_connect("/ws/triage") as socket:
+        socket.send_text(frame)
+        reply = socket.receive_json()
+        assert reply["type"] == "error" and reply["status"] == 422
+
+        socket.send_json({"type": "resume", "session_id": "unknown"})
+        assert socket.receive_json() == {"type": "error", "status": 404, "detail": "Session not found"}